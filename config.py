@@ -8,7 +8,7 @@ CosyVoice2 TTS 系统配置
 
 import os
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 @dataclass
 class CosyVoiceConfig:
@@ -20,9 +20,30 @@ class CosyVoiceConfig:
     sample_rate: int = 22050
     device: str = "auto"  # auto/cpu/cuda/mps
     
+    # 内置默认音色：名称 -> 参考音频和对应文本，初始化时提取一次特征
+    default_voices: Dict[str, Dict[str, str]] = field(default_factory=lambda: {
+        "default": {"audio": "test_audio_better.wav", "prompt_text": "你好"},
+        "short": {"audio": "test_audio_short.wav", "prompt_text": "你好"}
+    })
+    default_voice: str = "default"  # 未指定音色时使用
+    
     # 性能配置
     max_concurrent_requests: int = 4
+    max_queue_size: int = 32  # 推理准入队列深度，超出后直接拒绝
     request_timeout: int = 300
+    
+    # 缓存配置
+    prompt_cache_max_bytes: int = 256 * 1024 * 1024  # 参考音频缓存上限
+    speaker_cache_max_bytes: int = 128 * 1024 * 1024  # 说话人前端特征缓存上限
+    speaker_hot_cache_size: int = 512  # 常驻推理设备的已保存音色数
+    speaker_hot_cache_max_bytes: int = 256 * 1024 * 1024
+    
+    # 长文本分句配置
+    segment_max_chars: int = 120  # 单句最大字符数
+    pipeline_lookahead: int = 1  # 提前开始推理的后续句子数
+    
+    # 流式配置
+    stream_queue_size: int = 8  # 工作线程与消费者之间缓冲的音频块数
 
 @dataclass
 class APIConfig:
@@ -32,8 +53,17 @@ class APIConfig:
     debug: bool = False
     
     # 请求限制
-    max_text_length: int = 1000
+    max_text_length: int = 20000  # 长文本按句分段流水线合成
     max_file_size: int = 50 * 1024 * 1024  # 50MB
+    ws_max_inflight: int = 4  # 单个WebSocket连接上同时进行的合成请求数
+    ws_text_flush_ms: int = 800  # 增量文本未成句时的强制合成等待时间
+    
+    # 参考音频下载配置（共享连接池）
+    download_timeout: float = 30.0  # 单次下载总超时(秒)
+    download_connect_timeout: float = 5.0  # 建立连接超时(秒)
+    download_max_connections: int = 64
+    download_max_connections_per_host: int = 8
+    download_keepalive_timeout: float = 60.0  # 空闲连接保持时间(秒)
     
     # 安全配置
     cors_origins: List[str] = field(default_factory=lambda: ["*"])
@@ -45,6 +75,8 @@ class FileConfig:
     output_dir: str = "outputs"
     temp_dir: str = "temp"
     upload_dir: str = "uploads"
+    speaker_dir: str = "speakers"  # 已保存音色的索引和特征记录
+    url_cache_max_bytes: int = 1024 * 1024 * 1024  # 参考音频URL磁盘缓存上限（位于temp_dir/url_cache）
     
     # 清理配置
     auto_cleanup: bool = True
@@ -10,19 +10,21 @@ CosyVoice2 TTS API 服务
 import asyncio
 import logging
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import uvicorn
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, WebSocket, WebSocketDisconnect, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 # 认证相关导入已移除（简化版本不需要认证）
 from fastapi import Depends
 from pydantic import BaseModel, Field
+import base64
 import json
 import random
 import torch
 import time
+import uuid
 
 # 配置和服务
 from config import get_config
@@ -32,7 +34,13 @@ from tts_service import (
     TTSResult, 
     SynthesisMode, 
     AudioFormat,
-    AudioFileHandler
+    AudioFileHandler,
+    SchedulerError,
+    SchedulerBusyError,
+    CancelToken,
+    TextSegmenter,
+    AUDIO_MEDIA_TYPES,
+    create_stream_encoder
 )
 
 # 日志配置
@@ -75,7 +83,7 @@ tts_service = get_cosyvoice2_service()
 
 class BasicTTSRequest(BaseModel):
     """基础TTS请求"""
-    text: str = Field(..., description="要合成的文本", max_length=1000)
+    text: str = Field(..., description="要合成的文本", max_length=config.api.max_text_length)
     speaker: Optional[str] = Field(None, description="说话人（可选）")
     language: str = Field("zh", description="语言代码")
     speed: float = Field(1.0, description="语速倍率", ge=0.5, le=2.0)
@@ -161,6 +169,64 @@ def convert_result_to_response(result: TTSResult, request_id: str = None) -> TTS
             request_id=result.request_id or request_id
         )
 
+def check_stream_request(audio_format: AudioFormat):
+    """流式响应开始前的检查：输出格式不支持模型采样率时返回400，推理队列已满时返回503"""
+    try:
+        tts_service.check_stream_format(audio_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    tts_service.check_capacity()
+
+def stream_media_type(audio_format: AudioFormat) -> str:
+    """流式响应的媒体类型"""
+    if audio_format == AudioFormat.PCM:
+        return f"audio/L16; rate={tts_service.get_sample_rate()}; channels=1"
+    return AUDIO_MEDIA_TYPES[audio_format]
+
+async def iter_audio_bytes(chunks, http_request: Optional[Request] = None,
+                           cancel_token: Optional[CancelToken] = None):
+    """
+    将引擎输出的memoryview音频块转换为bytes交给HTTP响应
+    引擎复用缓冲区，传输层可能在send返回后仍持有数据，因此在这里做唯一一次拷贝；
+    客户端断开或响应提前结束时取消推理
+    """
+    async for chunk in cancel_on_disconnect(chunks, http_request, cancel_token):
+        yield bytes(chunk)
+
+async def cancel_on_disconnect(chunks, http_request: Optional[Request] = None,
+                               cancel_token: Optional[CancelToken] = None):
+    """
+    转发音频块，每块之间检查客户端是否已断开
+    断开、被取消或下游提前停止迭代时设置cancel_token并关闭引擎生成器，推理线程随即释放
+    """
+    finished = False
+    try:
+        async for chunk in chunks:
+            if http_request is not None and await http_request.is_disconnected():
+                logger.info("客户端已断开，取消流式合成")
+                break
+            yield chunk
+        else:
+            finished = True
+    finally:
+        if not finished and cancel_token is not None:
+            cancel_token.cancel()
+        await chunks.aclose()
+
+# ===== 异常处理 =====
+
+@app.exception_handler(SchedulerError)
+async def scheduler_error_handler(request, exc: SchedulerError):
+    """推理队列已满返回503，推理超时返回504"""
+    headers = {}
+    if isinstance(exc, SchedulerBusyError):
+        headers["Retry-After"] = str(exc.retry_after)
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"success": False, "error_message": str(exc)},
+        headers=headers
+    )
+
 # ===== 生命周期事件 =====
 
 @app.on_event("startup")
@@ -180,7 +246,7 @@ async def startup_event():
 async def shutdown_event():
     """应用关闭事件"""
     logger.info("🔄 关闭TTS服务...")
-    tts_service.cleanup()
+    await tts_service.close()
     logger.info("✅ TTS服务关闭完成")
 
 # ===== 基础API端点 =====
@@ -233,6 +299,8 @@ async def basic_tts(request: BasicTTSRequest, auth: bool = auth_dependency):
         result = await tts_service.synthesize(tts_request)
         return convert_result_to_response(result)
         
+    except SchedulerError:
+        raise
     except Exception as e:
         logger.error(f"基础TTS失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -266,14 +334,17 @@ async def zero_shot_tts(request: ZeroShotTTSRequest,
         
         if request.stream:
             # 流式响应
+            check_stream_request(tts_request.format)
             return StreamingResponse(
-                tts_service.synthesize_stream(tts_request),
-                media_type="audio/wav"
+                iter_audio_bytes(tts_service.synthesize_stream(tts_request), cancel_token=tts_request.cancel_token),
+                media_type=stream_media_type(tts_request.format)
             )
         else:
             result = await tts_service.synthesize(tts_request)
             return convert_result_to_response(result)
         
+    except (HTTPException, SchedulerError):
+        raise
     except Exception as e:
         logger.error(f"零样本TTS失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -306,6 +377,8 @@ async def cross_lingual_tts(request: CrossLingualTTSRequest,
         result = await tts_service.synthesize(tts_request)
         return convert_result_to_response(result)
         
+    except SchedulerError:
+        raise
     except Exception as e:
         logger.error(f"跨语言TTS失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -326,6 +399,8 @@ async def instruct_tts(request: InstructTTSRequest, auth: bool = auth_dependency
         result = await tts_service.synthesize(tts_request)
         return convert_result_to_response(result)
         
+    except SchedulerError:
+        raise
     except Exception as e:
         logger.error(f"指令式TTS失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -515,7 +590,10 @@ async def _ultimate_tts_impl(request: UltimateTTSRequest,
         auto_mode = request.mode
         if request.mode == "auto":
             # 智能选择最适合的模式
-            if request.instruct_text and prompt_audio_input:
+            if request.use_saved_speaker:
+                # 已保存音色：直接使用存储的特征，不需要参考音频
+                auto_mode = "instruct2" if request.instruct_text else "zero_shot"
+            elif request.instruct_text and prompt_audio_input:
                 auto_mode = "instruct2"  # CosyVoice2的自然语言控制
             elif request.prompt_text and prompt_audio_input:
                 # 检查是否为跨语言场景
@@ -574,9 +652,10 @@ async def _ultimate_tts_impl(request: UltimateTTSRequest,
         
         if request.stream:
             # 流式响应
+            check_stream_request(tts_request.format)
             return StreamingResponse(
-                tts_service.synthesize_stream(tts_request),
-                media_type="audio/wav",
+                iter_audio_bytes(tts_service.synthesize_stream(tts_request), cancel_token=tts_request.cancel_token),
+                media_type=stream_media_type(tts_request.format),
                 headers={
                     "X-TTS-Mode": auto_mode,
                     "X-TTS-Language": request.language,
@@ -593,6 +672,8 @@ async def _ultimate_tts_impl(request: UltimateTTSRequest,
             
             return response
             
+    except (HTTPException, SchedulerError):
+        raise
     except Exception as e:
         logger.error(f"全能TTS失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -622,24 +703,26 @@ def is_different_language(text1: str, text2: str) -> bool:
 # ===== 通用流式端点 =====
 
 @app.post("/api/v1/tts/stream")
-async def universal_tts_stream(request: BasicTTSRequest, auth: bool = auth_dependency):
+async def universal_tts_stream(request: BasicTTSRequest, http_request: Request, auth: bool = auth_dependency):
     """通用流式TTS端点，支持所有模式"""
     
+    # 构建TTS请求
+    tts_request = TTSRequest(
+        text=request.text,
+        mode=SynthesisMode.BASIC,  # 默认基础模式
+        speaker=request.speaker,
+        language=request.language,
+        speed=request.speed,
+        format=request.format,
+        stream=True
+    )
+    
     async def stream_generator():
         try:
-            # 构建TTS请求
-            tts_request = TTSRequest(
-                text=request.text,
-                mode=SynthesisMode.BASIC,  # 默认基础模式
-                speaker=request.speaker,
-                language=request.language,
-                speed=request.speed,
-                format=request.format,
-                stream=True
-            )
-            
-            # 流式合成并返回原始音频数据
-            async for audio_chunk in tts_service.synthesize_stream(tts_request):
+            # 流式合成并返回原始音频数据，客户端断开时取消推理
+            async for audio_chunk in iter_audio_bytes(
+                tts_service.synthesize_stream(tts_request), http_request, tts_request.cancel_token
+            ):
                 yield audio_chunk
             
         except Exception as e:
@@ -647,107 +730,443 @@ async def universal_tts_stream(request: BasicTTSRequest, auth: bool = auth_depen
             # 对于二进制流，我们无法发送错误消息
             return
     
-    return StreamingResponse(stream_generator(), media_type="audio/wav")
+    check_stream_request(request.format)
+    return StreamingResponse(stream_generator(), media_type=stream_media_type(request.format))
 
 # ===== WebSocket流式API =====
 
-@app.websocket("/api/v1/tts/ws")
-async def websocket_tts_stream(websocket: WebSocket):
-    """WebSocket流式TTS"""
-    await websocket.accept()
+class _TextStream:
+    """增量文本流状态：未成句的文本缓冲和待合成的句子队列"""
     
-    try:
+    def __init__(self, template: TTSRequest, binary: bool):
+        self.template = template
+        self.binary = binary
+        self.buffer = ""
+        self.sentences: asyncio.Queue = asyncio.Queue()
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.closed = False
+    
+    def push(self, sentence: str):
+        sentence = sentence.strip()
+        if sentence:
+            self.sentences.put_nowait(sentence)
+    
+    def flush(self):
+        """把缓冲区剩余文本作为一句提交"""
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        self.push(self.buffer)
+        self.buffer = ""
+
+class WebSocketTTSSession:
+    """
+    单个WebSocket连接上的TTS会话
+    每条合成请求以request_id标识，作为独立任务并发执行，音频帧带request_id标签交错发送；
+    文本流请求（text_start/text_delta/text_end）边接收文本边按句合成；
+    所有发送经由锁串行化，客户端可随时取消在途请求
+    """
+    
+    def __init__(self, websocket: WebSocket, binary_default: bool = False):
+        self.websocket = websocket
+        self.binary_default = binary_default
+        self.seq = 0
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.text_streams: Dict[str, _TextStream] = {}
+        self._send_lock = asyncio.Lock()
+    
+    async def send_control(self, message_type: str, request_id: Optional[str] = None, **fields):
+        """发送JSON控制消息"""
+        async with self._send_lock:
+            self.seq += 1
+            payload = {"type": message_type, "seq": self.seq}
+            if request_id is not None:
+                payload["request_id"] = request_id
+            payload.update(fields)
+            await self.websocket.send_text(json.dumps(payload))
+    
+    async def send_audio_frame(self, request_id: str, chunk_index: int, audio_chunk):
+        """
+        发送二进制音频帧
+        帧格式: [1字节request_id长度][request_id (UTF-8)][4字节大端块序号][音频数据]
+        """
+        tag = request_id.encode("utf-8")
+        frame = b"".join((bytes((len(tag),)), tag, chunk_index.to_bytes(4, "big"), audio_chunk))
+        async with self._send_lock:
+            self.seq += 1
+            await self.websocket.send_bytes(frame)
+    
+    async def send_audio(self, request_id: str, chunk_index: int, audio_chunk, binary: bool, elapsed_ms: float):
+        """按请求的传输方式发送一个音频块"""
+        if binary:
+            await self.send_audio_frame(request_id, chunk_index, audio_chunk)
+        else:
+            await self.send_control(
+                "audio_chunk",
+                request_id=request_id,
+                index=chunk_index,
+                data=base64.b64encode(audio_chunk).decode(),
+                elapsed_ms=round(elapsed_ms, 1)
+            )
+    
+    @staticmethod
+    def _request_id(message: dict) -> Optional[str]:
+        """消息中的request_id统一为字符串，客户端可以使用数字ID"""
+        request_id = message.get("request_id")
+        return None if request_id is None else str(request_id)
+    
+    async def run(self):
+        """读取客户端消息直到连接断开"""
         while True:
-            # 接收请求
-            data = await websocket.receive_text()
-            request_data = json.loads(data)
-            
-            # 验证请求
-            if "text" not in request_data:
-                await websocket.send_text(json.dumps({
-                    "type": "error",
-                    "message": "缺少必要的text参数"
-                }))
+            frame = await self.websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            data = frame.get("text")
+            if data is None:
+                await self.send_control("error", message="不支持二进制消息，请发送JSON文本消息")
+                continue
+            try:
+                message = json.loads(data)
+            except json.JSONDecodeError:
+                await self.send_control("error", message="无效的JSON消息")
+                continue
+            if not isinstance(message, dict):
+                await self.send_control("error", message="消息必须是JSON对象")
                 continue
             
-            # 构建TTS请求
+            message_type = message.get("type", "synthesize")
+            if message_type == "synthesize":
+                await self.start(message)
+            elif message_type == "text_start":
+                await self.start_text_stream(message)
+            elif message_type == "text_delta":
+                await self.append_text(message)
+            elif message_type == "text_end":
+                await self.end_text_stream(message)
+            elif message_type == "cancel":
+                await self.cancel(self._request_id(message))
+            else:
+                await self.send_control("error", request_id=self._request_id(message),
+                                        message=f"未知的消息类型: {message_type}")
+    
+    async def _admit(self, message: dict, text: str) -> Optional[Tuple[str, TTSRequest]]:
+        """校验请求并构建TTS请求，失败时发送错误消息并返回None"""
+        request_id = self._request_id(message) or uuid.uuid4().hex[:8]
+        
+        if len(request_id.encode("utf-8")) > 255:
+            await self.send_control("error", request_id=request_id, message="request_id过长")
+            return None
+        if request_id in self.tasks:
+            await self.send_control("error", request_id=request_id, message="request_id已在合成中")
+            return None
+        if len(self.tasks) >= config.api.ws_max_inflight:
+            await self.send_control("error", request_id=request_id,
+                                    message=f"在途请求过多 (上限 {config.api.ws_max_inflight})")
+            return None
+        
+        try:
             tts_request = TTSRequest(
-                text=request_data["text"],
-                mode=SynthesisMode(request_data.get("mode", "basic")),
-                speaker=request_data.get("speaker"),
-                language=request_data.get("language", "zh"),
-                speed=request_data.get("speed", 1.0),
-                format=AudioFormat(request_data.get("format", "wav")),
-                prompt_text=request_data.get("prompt_text"),
-                prompt_audio=request_data.get("prompt_audio_url"),
-                instruct_text=request_data.get("instruct_text"),
+                text=text,
+                mode=SynthesisMode(message.get("mode", "basic")),
+                speaker=message.get("speaker"),
+                language=message.get("language", "zh"),
+                speed=message.get("speed", 1.0),
+                format=AudioFormat(message.get("format", "wav")),
+                prompt_text=message.get("prompt_text"),
+                prompt_audio=message.get("prompt_audio_url"),
+                instruct_text=message.get("instruct_text"),
                 stream=True
             )
+            tts_service.check_stream_format(tts_request.format)
+        except ValueError as e:
+            await self.send_control("error", request_id=request_id, message=f"无效的请求参数: {e}")
+            return None
+        
+        return request_id, tts_request
+    
+    def _track(self, request_id: str, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self.tasks[request_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(request_id, None))
+    
+    async def start(self, message: dict):
+        """启动一条完整文本的合成请求"""
+        if "text" not in message:
+            await self.send_control("error", request_id=self._request_id(message), message="缺少必要的text参数")
+            return
+        
+        admitted = await self._admit(message, message["text"])
+        if admitted is None:
+            return
+        request_id, tts_request = admitted
+        binary = bool(message.get("binary", self.binary_default))
+        self._track(request_id, self._synthesize(request_id, tts_request, binary))
+    
+    async def start_text_stream(self, message: dict):
+        """开始一个增量文本流，后续通过text_delta追加文本"""
+        admitted = await self._admit(message, message.get("text", ""))
+        if admitted is None:
+            return
+        request_id, template = admitted
+        
+        stream = _TextStream(template, bool(message.get("binary", self.binary_default)))
+        self.text_streams[request_id] = stream
+        self._track(request_id, self._synthesize_text_stream(request_id, stream))
+        if template.text:
+            self._feed(request_id, stream, template.text)
+    
+    async def append_text(self, message: dict):
+        """追加文本增量，已成句的部分立即进入合成队列"""
+        request_id = self._request_id(message)
+        stream = self.text_streams.get(request_id)
+        if stream is None or stream.closed:
+            await self.send_control("error", request_id=request_id, message="文本流不存在或已结束")
+            return
+        self._feed(request_id, stream, message.get("text", ""))
+    
+    async def end_text_stream(self, message: dict):
+        """文本输入结束，剩余文本作为最后一句合成"""
+        request_id = self._request_id(message)
+        stream = self.text_streams.get(request_id)
+        if stream is None or stream.closed:
+            await self.send_control("error", request_id=request_id, message="文本流不存在或已结束")
+            return
+        stream.flush()
+        stream.closed = True
+        stream.sentences.put_nowait(None)
+    
+    def _feed(self, request_id: str, stream: _TextStream, delta: str):
+        stream.buffer += delta
+        sentences, stream.buffer = TextSegmenter.split_complete(
+            stream.buffer, config.cosyvoice.segment_max_chars
+        )
+        for sentence in sentences:
+            stream.push(sentence)
+        
+        # 超时仍未成句的文本也提交合成，避免上游停顿时音频长时间无输出
+        if stream.flush_handle is not None:
+            stream.flush_handle.cancel()
+            stream.flush_handle = None
+        if stream.buffer.strip():
+            stream.flush_handle = asyncio.get_event_loop().call_later(
+                config.api.ws_text_flush_ms / 1000, stream.flush
+            )
+    
+    async def cancel(self, request_id: Optional[str] = None):
+        """取消指定请求，未指定时取消全部在途请求"""
+        targets = list(self.tasks.values()) if request_id is None else [self.tasks.get(request_id)]
+        for task in targets:
+            if task is not None:
+                task.cancel()
+    
+    async def close(self):
+        """连接关闭时取消并等待所有在途请求"""
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _synthesize(self, request_id: str, tts_request: TTSRequest, binary: bool):
+        """流式合成一条请求并发送带标签的音频"""
+        started = time.perf_counter()
+        first_chunk_ms = None
+        chunk_count = 0
+        byte_count = 0
+        try:
+            await self.send_control(
+                "status",
+                request_id=request_id,
+                message="开始合成...",
+                binary=binary,
+                format=tts_request.format.value,
+                sample_rate=tts_service.get_sample_rate()
+            )
             
-            # 流式合成
+            async for audio_chunk in tts_service.synthesize_stream(tts_request):
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                if first_chunk_ms is None:
+                    first_chunk_ms = elapsed_ms
+                await self.send_audio(request_id, chunk_count, audio_chunk, binary, elapsed_ms)
+                chunk_count += 1
+                byte_count += len(audio_chunk)
+            
+            await self.send_control(
+                "end",
+                request_id=request_id,
+                message="合成完成",
+                chunks=chunk_count,
+                bytes=byte_count,
+                first_chunk_ms=round(first_chunk_ms, 1) if first_chunk_ms is not None else None,
+                elapsed_ms=round((time.perf_counter() - started) * 1000, 1)
+            )
+        
+        except asyncio.CancelledError:
+            tts_request.cancel_token.cancel()
             try:
-                await websocket.send_text(json.dumps({
-                    "type": "status",
-                    "message": "开始合成..."
-                }))
-                
-                async for audio_chunk in tts_service.synthesize_stream(tts_request):
-                    # 发送音频块（Base64编码）
-                    import base64
-                    audio_b64 = base64.b64encode(audio_chunk).decode()
-                    await websocket.send_text(json.dumps({
-                        "type": "audio_chunk",
-                        "data": audio_b64
-                    }))
+                await self.send_control("cancelled", request_id=request_id, chunks=chunk_count)
+            except Exception:
+                pass
+            raise
+        except WebSocketDisconnect:
+            tts_request.cancel_token.cancel()
+        except Exception as e:
+            try:
+                await self.send_control("error", request_id=request_id, message=f"合成失败: {str(e)}")
+            except Exception:
+                pass
+    
+    async def _synthesize_text_stream(self, request_id: str, stream: _TextStream):
+        """
+        按句合成增量文本流
+        各句按到达顺序依次合成，音频块序号在整个流内连续；WAV格式只在流开头发送一次文件头，
+        压缩格式的各句PCM输出送入同一个编码器，客户端收到的是一条连续的音频流
+        """
+        template = stream.template
+        started = time.perf_counter()
+        first_chunk_ms = None
+        chunk_count = 0
+        byte_count = 0
+        sentence_count = 0
+        loop = asyncio.get_event_loop()
+        try:
+            await self.send_control(
+                "status",
+                request_id=request_id,
+                message="等待文本...",
+                binary=stream.binary,
+                format=template.format.value,
+                sample_rate=tts_service.get_sample_rate()
+            )
+            
+            encoder = create_stream_encoder(template.format, tts_service.get_sample_rate())
+            header = encoder.start()
+            if header:
+                await self.send_audio(request_id, chunk_count, header, stream.binary, 0.0)
+                chunk_count += 1
+                byte_count += len(header)
+            
+            while True:
+                sentence = await stream.sentences.get()
+                if sentence is None:
+                    break
                 
-                await websocket.send_text(json.dumps({
-                    "type": "end",
-                    "message": "合成完成"
-                }))
+                await self.send_control("sentence", request_id=request_id, index=sentence_count, text=sentence)
+                sentence_count += 1
                 
-            except Exception as e:
-                await websocket.send_text(json.dumps({
-                    "type": "error",
-                    "message": f"合成失败: {str(e)}"
-                }))
+                tts_request = TTSRequest(
+                    text=sentence,
+                    mode=template.mode,
+                    speaker=template.speaker,
+                    language=template.language,
+                    speed=template.speed,
+                    format=AudioFormat.PCM,
+                    prompt_text=template.prompt_text,
+                    prompt_audio=template.prompt_audio,
+                    instruct_text=template.instruct_text,
+                    stream=True,
+                    cancel_token=template.cancel_token
+                )
+                async for audio_chunk in tts_service.synthesize_stream(tts_request):
+                    if not encoder.zero_copy:
+                        # 压缩格式在线程池中编码，同一编码器跨句复用，整个流只有一个文件头
+                        audio_chunk = await loop.run_in_executor(None, encoder.encode_pcm16, bytes(audio_chunk))
+                        if not audio_chunk:
+                            continue
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    if first_chunk_ms is None:
+                        first_chunk_ms = elapsed_ms
+                    await self.send_audio(request_id, chunk_count, audio_chunk, stream.binary, elapsed_ms)
+                    chunk_count += 1
+                    byte_count += len(audio_chunk)
+            
+            tail = await loop.run_in_executor(None, encoder.finish)
+            if tail:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                await self.send_audio(request_id, chunk_count, tail, stream.binary, elapsed_ms)
+                chunk_count += 1
+                byte_count += len(tail)
+            
+            await self.send_control(
+                "end",
+                request_id=request_id,
+                message="合成完成",
+                sentences=sentence_count,
+                chunks=chunk_count,
+                bytes=byte_count,
+                first_chunk_ms=round(first_chunk_ms, 1) if first_chunk_ms is not None else None,
+                elapsed_ms=round((time.perf_counter() - started) * 1000, 1)
+            )
+        
+        except asyncio.CancelledError:
+            template.cancel_token.cancel()
+            try:
+                await self.send_control("cancelled", request_id=request_id, chunks=chunk_count)
+            except Exception:
+                pass
+            raise
+        except WebSocketDisconnect:
+            template.cancel_token.cancel()
+        except Exception as e:
+            try:
+                await self.send_control("error", request_id=request_id, message=f"合成失败: {str(e)}")
+            except Exception:
+                pass
+        finally:
+            if stream.flush_handle is not None:
+                stream.flush_handle.cancel()
+            self.text_streams.pop(request_id, None)
+
+@app.websocket("/api/v1/tts/ws")
+async def websocket_tts_stream(websocket: WebSocket):
+    """
+    WebSocket流式TTS
+    一个连接上可同时有多条以request_id区分的合成请求，支持取消；
+    控制消息为JSON文本帧，音频为base64 JSON消息或带标签的二进制帧（binary=true）
+    """
+    await websocket.accept()
+    binary_default = websocket.query_params.get("binary", "false").lower() in ("1", "true")
+    session = WebSocketTTSSession(websocket, binary_default)
     
+    try:
+        await session.run()
     except WebSocketDisconnect:
         logger.info("WebSocket客户端断开连接")
     except Exception as e:
         logger.error(f"WebSocket错误: {e}")
         try:
-            await websocket.send_text(json.dumps({
-                "type": "error",
-                "message": f"服务器错误: {str(e)}"
-            }))
+            await session.send_control("error", message=f"服务器错误: {str(e)}")
         except:
             pass
+    finally:
+        await session.close()
 
 # ===== Server-Sent Events (SSE) API =====
 
 @app.post("/api/v1/tts/sse")
-async def sse_tts_stream(request: ZeroShotTTSRequest, auth: bool = auth_dependency):
+async def sse_tts_stream(request: ZeroShotTTSRequest, http_request: Request, auth: bool = auth_dependency):
     """Server-Sent Events流式TTS"""
     
+    # 构建TTS请求
+    tts_request = TTSRequest(
+        text=request.text,
+        mode=SynthesisMode.ZERO_SHOT,
+        prompt_text=request.prompt_text,
+        prompt_audio=request.prompt_audio_url,
+        language=request.language,
+        speed=request.speed,
+        format=request.format,
+        stream=True
+    )
+    
     async def event_generator():
         try:
-            # 构建TTS请求
-            tts_request = TTSRequest(
-                text=request.text,
-                mode=SynthesisMode.ZERO_SHOT,
-                prompt_text=request.prompt_text,
-                prompt_audio=request.prompt_audio_url,
-                language=request.language,
-                speed=request.speed,
-                format=request.format,
-                stream=True
-            )
-            
             yield f"data: {json.dumps({'status': 'processing', 'message': '开始合成...'})}\n\n"
             
-            async for audio_chunk in tts_service.synthesize_stream(tts_request):
+            async for audio_chunk in cancel_on_disconnect(
+                tts_service.synthesize_stream(tts_request), http_request, tts_request.cancel_token
+            ):
                 # 发送音频块（Base64编码）
-                import base64
                 audio_b64 = base64.b64encode(audio_chunk).decode()
                 yield f"data: {json.dumps({'type': 'audio_chunk', 'data': audio_b64})}\n\n"
             
@@ -756,6 +1175,7 @@ async def sse_tts_stream(request: ZeroShotTTSRequest, auth: bool = auth_dependen
         except Exception as e:
             yield f"data: {json.dumps({'error': f'合成失败: {str(e)}'})}\n\n"
     
+    check_stream_request(request.format)
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
 # ===== 健康检查 =====
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+音频编码器测试脚本
+验证流式编码器的增量输出和文件输出，以及流式Opus的采样率检查，不需要启动API服务和加载模型
+"""
+
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import soundfile
+import torch
+
+from tts_service import (
+    AudioEncoder, AudioFormat, CosyVoice2Engine, PCMStreamEncoder, SoundFileEncoder, TTSRequest,
+    check_stream_format, create_stream_encoder
+)
+
+def sine(sample_rate, seconds, frequency=220.0, amplitude=0.5):
+    t = np.arange(int(sample_rate * seconds), dtype=np.float32) / sample_rate
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+def encode_stream(encoder, audio, chunk_size):
+    """逐块编码，返回(全部编码数据, 结束前产生数据的块数)"""
+    parts = [encoder.start()]
+    for start in range(0, len(audio), chunk_size):
+        parts.append(bytes(encoder.encode(torch.from_numpy(audio[start:start + chunk_size]))))
+    produced = sum(1 for part in parts[1:] if part)
+    parts.append(encoder.finish())
+    return b''.join(parts), produced
+
+def test_encoders():
+    """测试流式编码器"""
+    try:
+        AudioEncoder()
+        raise AssertionError("AudioEncoder不应能直接实例化")
+    except TypeError:
+        pass
+
+    # WAV/PCM：文件头加逐块int16转换，与clip后乘32767截断一致
+    audio = sine(22050, 0.5, amplitude=1.2)
+    encoder = create_stream_encoder(AudioFormat.WAV, 22050)
+    assert isinstance(encoder, PCMStreamEncoder) and encoder.zero_copy
+    data, _ = encode_stream(encoder, audio, 4096)
+    assert data[:4] == b'RIFF' and data[36:40] == b'data'
+    expected = (np.clip(audio, -1.0, 1.0) * 32767.0).astype(np.int16)
+    assert np.array_equal(np.frombuffer(data[44:], dtype=np.int16), expected)
+    assert encoder.encode_pcm16(b'\x01\x02') == b'\x01\x02'
+    print("  PCM/WAV编码")
+
+    # 压缩格式在结束前就陆续输出数据，拼接结果可以直接解码
+    audio = sine(48000, 2.0)
+    for audio_format, magic in ((AudioFormat.MP3, None), (AudioFormat.OPUS, b'OggS'), (AudioFormat.FLAC, b'fLaC')):
+        data, produced = encode_stream(create_stream_encoder(audio_format, 48000), audio, 4800)
+        assert produced > 1, f"{audio_format.value}没有增量输出"
+        if magic:
+            assert data.startswith(magic)
+        if audio_format != AudioFormat.FLAC:
+            # 流式FLAC的STREAMINFO中没有总长度，libsndfile无法按文件读取
+            decoded, sample_rate = soundfile.read(io.BytesIO(data), dtype='float32')
+            assert sample_rate == 48000
+            assert abs(len(decoded) - len(audio)) < 48000 * 0.1, f"{audio_format.value}解码长度 {len(decoded)}"
+    print("  MP3/Opus/FLAC增量编码")
+
+    # s16le输入与浮点输入编码结果一致
+    pcm = (audio * 32767.0).astype(np.int16).tobytes()
+    encoder = SoundFileEncoder(AudioFormat.OPUS, 48000)
+    data = encoder.encode_pcm16(pcm) + encoder.finish()
+    assert data.startswith(b'OggS')
+    print("  PCM字节再编码")
+
+    # 文件输出结束时回填文件头
+    temp_dir = tempfile.mkdtemp(prefix="encoder_test_")
+    try:
+        for audio_format in (AudioFormat.WAV, AudioFormat.FLAC, AudioFormat.MP3, AudioFormat.OPUS):
+            path = os.path.join(temp_dir, f"out.{audio_format.value}")
+            encoder = SoundFileEncoder(audio_format, 48000, output=path)
+            for start in range(0, len(audio), 4800):
+                assert encoder.encode(torch.from_numpy(audio[start:start + 4800])) == b''
+            encoder.finish()
+            info = soundfile.info(path)
+            assert info.samplerate == 48000
+            assert abs(info.frames - len(audio)) < 48000 * 0.1, f"{audio_format.value}文件长度 {info.frames}"
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    print("  文件输出")
+
+    try:
+        SoundFileEncoder(AudioFormat.OPUS, 22050)
+        raise AssertionError("Opus应拒绝不支持的采样率")
+    except ValueError:
+        pass
+    print("  Opus采样率检查")
+
+class FakeCosyVoice:
+    sample_rate = 22050
+
+def test_opus_stream_sample_rate():
+    """流式Opus在模型采样率不受支持时，在产生任何输出之前拒绝"""
+    check_stream_format(AudioFormat.OPUS, 24000)
+    check_stream_format(AudioFormat.MP3, 22050)
+    try:
+        check_stream_format(AudioFormat.OPUS, 22050)
+        raise AssertionError("流式Opus应拒绝22050Hz")
+    except ValueError:
+        pass
+
+    engine = CosyVoice2Engine()
+    engine.cosyvoice = FakeCosyVoice()
+    engine.is_initialized = True
+
+    async def first_chunk():
+        stream = engine.synthesize_stream(TTSRequest("你好", format=AudioFormat.OPUS))
+        try:
+            await stream.__anext__()
+            raise AssertionError("流式Opus不应输出文件头")
+        except ValueError:
+            pass
+
+    asyncio.run(first_chunk())
+    engine.scheduler.shutdown()
+    print("  流式Opus采样率检查")
+
+def main():
+    """运行音频编码器测试"""
+    print("开始音频编码器测试")
+    test_encoders()
+    test_opus_stream_sample_rate()
+    print("音频编码器测试通过")
+
+if __name__ == "__main__":
+    main()
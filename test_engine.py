@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+合成引擎测试脚本
+用模拟的CosyVoice2前端和模型驱动CosyVoice2Engine，验证送入model.tts的输入，不需要启动API服务和加载模型
+"""
+
+import asyncio
+import threading
+import time
+
+from tts_service import CosyVoice2Engine, SynthesisMode, TTSRequest
+
+STORED_PROMPT = "保存音色时的提示文本"
+
+class FakeFrontend:
+    """按原文返回文本token，便于检查模型收到的输入"""
+
+    def __init__(self):
+        self.spk2info = {}
+
+    def text_normalize(self, text, split=True, text_frontend=True):
+        return [text] if split else text
+
+    def _extract_text_token(self, text):
+        return text, len(text)
+
+class FakeModel:
+    """记录每次tts调用的输入，产出一个空音频块"""
+
+    device = None
+
+    def __init__(self):
+        self.calls = []
+
+    def tts(self, **kwargs):
+        self.calls.append(kwargs)
+        yield {"tts_speech": None}
+
+class FakeCosyVoice:
+    sample_rate = 24000
+
+    def __init__(self):
+        self.frontend = FakeFrontend()
+        self.model = FakeModel()
+
+def stored_features():
+    return {
+        "prompt_text": STORED_PROMPT,
+        "prompt_text_len": len(STORED_PROMPT),
+        "llm_prompt_speech_token": "speech_token",
+        "llm_prompt_speech_token_len": 1,
+        "flow_prompt_speech_token": "speech_token",
+        "flow_prompt_speech_token_len": 1,
+        "prompt_speech_feat": "speech_feat",
+        "prompt_speech_feat_len": 1,
+        "llm_embedding": "embedding",
+        "flow_embedding": "embedding",
+    }
+
+class FakeRegistry:
+    """已保存说话人注册表，记录读取发生在哪个线程"""
+
+    def __init__(self, speakers):
+        self.speakers = speakers
+        self.threads = []
+
+    def __contains__(self, speaker_id):
+        self.threads.append(threading.current_thread().name)
+        return speaker_id in self.speakers
+
+    def get(self, speaker_id):
+        self.threads.append(threading.current_thread().name)
+        return self.speakers.get(speaker_id)
+
+def create_engine():
+    engine = CosyVoice2Engine()
+    engine.cosyvoice = FakeCosyVoice()
+    engine._default_voices = {engine.config.cosyvoice.default_voice: stored_features()}
+    return engine
+
+def test_instruct_with_default_voice():
+    """没有参考音频的指令合成使用默认音色，指令文本替换默认音色的提示文本"""
+    engine = create_engine()
+    outputs = engine._prompt_inference(
+        SynthesisMode.INSTRUCT2,
+        tts_text="今天天气不错",
+        instruct_text="用开心的语气说",
+        zero_shot_spk_id=engine._default_voice_id(),
+    )
+    list(outputs)
+
+    call = engine.cosyvoice.model.calls[0]
+    assert call["prompt_text"] == "用开心的语气说<|endofprompt|>"
+    assert call["prompt_text_len"] == len("用开心的语气说<|endofprompt|>")
+    assert "llm_prompt_speech_token" not in call
+    assert call["flow_prompt_speech_token"] == "speech_token"
+    assert call["text"] == "今天天气不错"
+    # 缓存的默认音色特征不被修改
+    assert engine._default_voices[engine.config.cosyvoice.default_voice]["prompt_text"] == STORED_PROMPT
+    print("  指令文本送入模型")
+
+def test_instruct_with_saved_speaker():
+    """已保存音色的指令合成同样使用指令文本，而不是退化为零样本合成"""
+    engine = create_engine()
+    engine.cosyvoice.frontend.spk2info["alice"] = stored_features()
+    request = TTSRequest("今天天气不错", mode=SynthesisMode.INSTRUCT,
+                         instruct_text="用四川话说", zero_shot_spk_id="alice")
+    mode = engine._saved_speaker_mode(request)
+    assert mode == SynthesisMode.INSTRUCT2
+    list(engine._prompt_inference(
+        mode,
+        tts_text=request.text,
+        instruct_text=request.instruct_text,
+        zero_shot_spk_id=request.zero_shot_spk_id,
+    ))
+
+    call = engine.cosyvoice.model.calls[0]
+    assert call["prompt_text"] == "用四川话说<|endofprompt|>"
+    assert "llm_prompt_speech_token" not in call
+    assert engine.cosyvoice.frontend.spk2info["alice"]["prompt_text"] == STORED_PROMPT
+    print("  已保存音色的指令文本送入模型")
+
+def test_zero_shot_keeps_stored_prompt():
+    """零样本合成仍使用存储的提示文本和提示语音token"""
+    engine = create_engine()
+    list(engine._prompt_inference(
+        SynthesisMode.ZERO_SHOT,
+        tts_text="今天天气不错",
+        zero_shot_spk_id=engine._default_voice_id(),
+    ))
+
+    call = engine.cosyvoice.model.calls[0]
+    assert call["prompt_text"] == STORED_PROMPT
+    assert call["llm_prompt_speech_token"] == "speech_token"
+    print("  零样本合成保留存储的提示文本")
+
+def test_pipeline_uses_idle_workers():
+    """分句流水线只借用空闲的推理线程预取后续句子，线程全部占用时在调用线程中顺序推理"""
+    engine = create_engine()
+    sentences = ["第一句", "第二句", "第三句"]
+    threads = {}
+
+    def make_outputs(sentence):
+        threads[sentence] = threading.current_thread().name
+        if sentence == sentences[0]:
+            time.sleep(0.2)
+        yield f"{sentence}#0"
+        yield f"{sentence}#1"
+
+    expected = [f"{sentence}#{index}" for sentence in sentences for index in range(2)]
+    assert list(engine._pipelined_outputs(sentences, make_outputs)) == expected
+    assert threads[sentences[0]] == threading.current_thread().name
+    assert threads[sentences[1]].startswith("cosyvoice-infer")
+    print("  有空闲线程时预取后续句子")
+
+    release = threading.Event()
+    blockers = [engine.scheduler.submit(release.wait) for _ in range(engine.scheduler.max_workers)]
+    try:
+        threads.clear()
+        assert list(engine._pipelined_outputs(sentences, make_outputs)) == expected
+        assert set(threads.values()) == {threading.current_thread().name}
+    finally:
+        release.set()
+        for blocker in blockers:
+            blocker.result()
+    engine.scheduler.shutdown()
+    print("  线程占满时不超出并发上限")
+
+def test_speaker_prefetch():
+    """已保存音色的预取在推理线程中读取注册表，任务引用在完成后释放"""
+    engine = create_engine()
+    engine.speakers = FakeRegistry({"bob": stored_features()})
+
+    async def prefetch():
+        engine._start_speaker_prefetch(TTSRequest("你好", zero_shot_spk_id="bob"))
+        assert len(engine._prefetch_tasks) == 1
+        await asyncio.gather(*engine._prefetch_tasks)
+        await asyncio.sleep(0)
+        assert not engine._prefetch_tasks
+
+    asyncio.run(prefetch())
+    assert engine._speaker_contexts.contains("bob")
+    assert engine.speakers.threads and all(name.startswith("cosyvoice-infer") for name in engine.speakers.threads)
+    print("  预取在推理线程中进行")
+
+    # 推理线程全部占用时跳过预取，不在事件循环中读取注册表
+    engine._speaker_contexts.clear()
+    engine.speakers.threads.clear()
+    release = threading.Event()
+    blockers = [engine.scheduler.submit(release.wait) for _ in range(engine.scheduler.max_workers)]
+    try:
+        asyncio.run(engine.prefetch_speaker("bob"))
+        assert not engine.speakers.threads and not engine._speaker_contexts.contains("bob")
+    finally:
+        release.set()
+        for blocker in blockers:
+            blocker.result()
+    engine.scheduler.shutdown()
+    print("  推理线程占满时跳过预取")
+
+def main():
+    """运行合成引擎测试"""
+    print("开始合成引擎测试")
+    test_instruct_with_default_voice()
+    test_instruct_with_saved_speaker()
+    test_zero_shot_keeps_stored_prompt()
+    test_pipeline_uses_idle_workers()
+    test_speaker_prefetch()
+    print("合成引擎测试通过")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+LRU缓存测试脚本
+验证按字节数和条目数限额的淘汰与统计，不需要启动API服务和加载模型
+"""
+
+from tts_service import ByteLRUCache
+
+def test_byte_lru_cache():
+    """测试按字节数限额的LRU缓存"""
+    cache = ByteLRUCache(max_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+    cache.put("c", b"cccc")
+    assert not cache.contains("b") and cache.contains("a") and cache.contains("c")
+    assert cache.current_bytes == 8
+    cache.put("d", b"d" * 11)
+    assert not cache.contains("d")
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["hits"] == 1
+    assert cache.get("b") is None and cache.stats()["misses"] == 1
+    assert cache.invalidate("a") and cache.current_bytes == 4
+    print("  字节限额淘汰")
+
+    cache = ByteLRUCache(max_bytes=100, max_entries=2)
+    for key in "xyz":
+        cache.put(key, b"1")
+    assert len(cache) == 2 and not cache.contains("x")
+    cache.put("y", b"22")
+    assert cache.current_bytes == 3
+    cache.clear()
+    assert len(cache) == 0 and cache.current_bytes == 0
+    print("  条目数限额")
+
+def main():
+    """运行LRU缓存测试"""
+    print("开始LRU缓存测试")
+    test_byte_lru_cache()
+    print("LRU缓存测试通过")
+
+if __name__ == "__main__":
+    main()
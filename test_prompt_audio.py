@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+参考音频处理测试脚本
+验证去除首尾静音和后处理归一化，不需要启动API服务和加载模型
+"""
+
+import numpy as np
+import torch
+
+from tts_service import AudioFileHandler
+
+def sine(sample_rate, seconds, frequency=220.0, amplitude=0.5):
+    t = np.arange(int(sample_rate * seconds), dtype=np.float32) / sample_rate
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+def test_trim_silence():
+    """测试去除首尾静音"""
+    sample_rate = 16000
+    silence = np.zeros(sample_rate // 2, dtype=np.float32)
+    voiced = sine(sample_rate, 1.0)
+    speech = torch.from_numpy(np.concatenate([silence, voiced, silence]))[None]
+
+    trimmed = AudioFileHandler.trim_silence(speech, top_db=60, frame_length=440, hop_length=220)
+    offset = trimmed.storage_offset()
+    end = offset + trimmed.shape[-1]
+    # 返回原张量的切片，边界误差不超过一帧
+    assert torch.equal(trimmed, speech[..., offset:end])
+    assert abs(offset - len(silence)) <= 440
+    assert abs(end - len(silence) - len(voiced)) <= 440
+    assert AudioFileHandler.trim_silence(torch.zeros(1, sample_rate)).numel() == 0
+    print("  首尾静音")
+
+    # 后处理裁剪后复制为独立张量并归一化，不持有原始音频
+    loud = speech * 2.0
+    processed = AudioFileHandler.postprocess(loud)
+    assert processed.untyped_storage().nbytes() == processed.numel() * processed.element_size()
+    assert abs(float(processed.abs().max()) - 0.8) < 1e-4
+    assert float(loud.abs().max()) > 0.9
+    print("  后处理复制裁剪结果")
+
+def main():
+    """运行参考音频处理测试"""
+    print("开始参考音频处理测试")
+    test_trim_silence()
+    print("参考音频处理测试通过")
+
+if __name__ == "__main__":
+    main()
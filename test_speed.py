@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+流式变速测试脚本
+逐块送入正弦波验证WSOLA变速的输出长度和音高，不需要启动API服务和加载模型
+"""
+
+import numpy as np
+import torch
+
+from tts_service import WSOLAStretcher
+
+def sine(sample_rate, seconds, frequency=220.0, amplitude=0.5):
+    t = np.arange(int(sample_rate * seconds), dtype=np.float32) / sample_rate
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+def test_wsola_stretcher():
+    """测试流式变速"""
+    sample_rate = 16000
+    audio = sine(sample_rate, 2.0)
+    for speed in (0.8, 1.0, 1.5):
+        stretcher = WSOLAStretcher(speed, sample_rate)
+        outputs = [stretcher.process(torch.from_numpy(audio[start:start + 1000])).reshape(-1).numpy()
+                   for start in range(0, len(audio), 1000)]
+        outputs.append(stretcher.flush().reshape(-1).numpy())
+        stretched = np.concatenate(outputs)
+        assert len(stretched) == round(len(audio) / speed), f"speed={speed} 输出长度 {len(stretched)}"
+        # 不改变音高：稳定段的过零率与原音频一致
+        middle = stretched[len(stretched) // 4:len(stretched) * 3 // 4]
+        crossings = np.count_nonzero(np.diff(np.signbit(middle))) / len(middle) * sample_rate / 2
+        assert abs(crossings - 220.0) < 10.0, f"speed={speed} 频率 {crossings}"
+    print("  输出长度与音高")
+
+
+def main():
+    """运行流式变速测试"""
+    print("开始流式变速测试")
+    test_wsola_stretcher()
+    print("流式变速测试通过")
+
+if __name__ == "__main__":
+    main()
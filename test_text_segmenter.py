@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+分句器测试脚本
+验证整段分句和增量分句的切分结果，不需要启动API服务和加载模型
+"""
+
+from tts_service import TextSegmenter
+
+def test_split():
+    """测试整段分句"""
+    assert TextSegmenter.split("你好。今天天气很好！", min_chars=1) == ["你好。", "今天天气很好！"]
+    # 小数点不是句末，右引号归入前一句
+    assert TextSegmenter.split("价格是3.5元。好的", min_chars=1) == ["价格是3.5元。", "好的"]
+    assert TextSegmenter.split('他说："走吧。"然后离开了。', min_chars=1) == ['他说："走吧。"', "然后离开了。"]
+    assert TextSegmenter.split("Hello there. How are you?", min_chars=1) == ["Hello there.", "How are you?"]
+    print("  按句末标点切分")
+
+    # 常见的中文短句各自成段，分句流水线才能在第一句播放时合成后续句子
+    assert TextSegmenter.split("你好。今天天气很好！我们去公园吧？") == ["你好。", "今天天气很好！", "我们去公园吧？"]
+    # 朗读长度过短的片段并入前一句
+    assert TextSegmenter.split("今天天气很好啊朋友们。好。") == ["今天天气很好啊朋友们。好。"]
+    assert TextSegmenter.split("How are you? Ok.") == ["How are you? Ok."]
+    print("  短句按朗读长度合并")
+
+    # 过长的句子在逗号处切分
+    long_text = "，".join(["这是一个比较长的分句"] * 10) + "。"
+    segments = TextSegmenter.split(long_text, max_chars=30)
+    assert all(len(segment) <= 30 for segment in segments)
+    assert "".join(segments) == long_text
+    print("  长句在逗号处切分")
+
+def test_split_complete():
+    """测试增量分句：句末标点后出现后续字符才确认结束"""
+    assert TextSegmenter.split_complete("第一句话说完了。第二") == (["第一句话说完了。"], "第二")
+    assert TextSegmenter.split_complete("第一句话说完了。") == ([], "第一句话说完了。")
+    assert TextSegmenter.split_complete("版本号是3.") == ([], "版本号是3.")
+    assert TextSegmenter.split_complete("版本号是3.5") == ([], "版本号是3.5")
+    assert TextSegmenter.split_complete("你好。今天天气很好！我们") == (["你好。", "今天天气很好！"], "我们")
+    sentences, remainder = TextSegmenter.split_complete("没有标点，" * 10, max_chars=20)
+    assert sentences and all(len(sentence) <= 20 for sentence in sentences) and len(remainder) <= 20
+    print("  增量分句")
+
+def main():
+    """运行分句器测试"""
+    print("开始分句器测试")
+    test_split()
+    test_split_complete()
+    print("分句器测试通过")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+参考音频URL缓存测试脚本
+使用本地HTTP服务器模拟CDN，验证缓存命中、条件请求、淘汰和解码结果持久化，不需要启动API服务和加载模型
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from tts_service import AudioDownloader, AudioFileHandler, URLAudioCache, http_cache_policy, silent_wav_bytes
+
+class FakeCDNHandler(BaseHTTPRequestHandler):
+    """按路径返回不同缓存头的音频文件，记录收到的请求"""
+
+    protocol_version = "HTTP/1.1"
+    # 路径 -> (内容, ETag, Cache-Control)
+    files = {}
+    requests = []
+
+    def do_GET(self):
+        body, etag, cache_control = self.files[self.path]
+        self.requests.append((self.path, self.headers.get("If-None-Match")))
+
+        if etag and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            if cache_control:
+                self.send_header("Cache-Control", cache_control)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        if cache_control:
+            self.send_header("Cache-Control", cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeCDNHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def count_requests(path):
+    return sum(1 for requested, _ in FakeCDNHandler.requests if requested == path)
+
+async def run_cache_tests(base_url, cache_dir):
+    audio = silent_wav_bytes(16000, 0.5)
+    FakeCDNHandler.files = {
+        "/fresh.wav": (audio, '"v1"', "max-age=60"),
+        "/revalidate.wav": (audio, '"v1"', "no-cache"),
+        "/private.wav": (audio, None, "no-store"),
+        "/concurrent.wav": (audio, '"v1"', "max-age=60"),
+        "/revoked.wav": (audio, '"v1"', "no-cache"),
+    }
+    downloader = AudioDownloader(max_bytes=1024 * 1024, cache=URLAudioCache(cache_dir, 64 * 1024))
+    try:
+        # 新鲜期内的重复请求不访问网络
+        first = await downloader.download(base_url + "/fresh.wav")
+        second = await downloader.download(base_url + "/fresh.wav")
+        assert first == second and downloader.cache.owns(first)
+        assert count_requests("/fresh.wav") == 1
+        print("  新鲜期内命中缓存")
+
+        # no-cache响应每次都条件请求，未变化时服务器返回304
+        first = await downloader.download(base_url + "/revalidate.wav")
+        second = await downloader.download(base_url + "/revalidate.wav")
+        assert first == second
+        assert FakeCDNHandler.requests[-1] == ("/revalidate.wav", '"v1"')
+        assert downloader.cache.stats()["revalidated"] == 1
+        print("  条件请求返回304时复用缓存")
+
+        # 内容变化后重新下载，旧的解码结果随之失效
+        downloader.cache.store_speech(first, np.zeros((1, 8000), dtype=np.float32))
+        FakeCDNHandler.files["/revalidate.wav"] = (audio + b"\0\0", '"v2"', "no-cache")
+        changed = await downloader.download(base_url + "/revalidate.wav")
+        assert os.path.getsize(changed) == len(audio) + 2
+        assert downloader.cache.load_speech(changed) is None
+        print("  ETag变化时更新缓存")
+
+        # no-store响应下载到临时文件，不进入缓存，用完后删除
+        private = await downloader.download(base_url + "/private.wav")
+        assert not downloader.cache.owns(private)
+        AudioFileHandler.discard_temp_file(private)
+        assert not os.path.exists(private)
+        print("  no-store响应不缓存")
+
+        # 缓存目录位于系统临时目录下时，清理临时文件也不会删除缓存文件
+        AudioFileHandler.discard_temp_file(first)
+        assert os.path.exists(first) and downloader.cache.owns(first)
+        print("  缓存文件不被当作临时文件删除")
+
+        # 304响应改为no-store时删除缓存条目，重新下载到临时文件
+        revoked = await downloader.download(base_url + "/revoked.wav")
+        assert downloader.cache.owns(revoked)
+        FakeCDNHandler.files["/revoked.wav"] = (audio, '"v1"', "no-store")
+        refetched = await downloader.download(base_url + "/revoked.wav")
+        assert not os.path.exists(revoked) and not downloader.cache.owns(refetched)
+        assert FakeCDNHandler.requests[-2:] == [("/revoked.wav", '"v1"'), ("/revoked.wav", None)]
+        AudioFileHandler.discard_temp_file(refetched)
+        print("  304响应禁止缓存时删除条目")
+
+        # 同一URL的并发请求只下载一次
+        paths = await asyncio.gather(*[downloader.download(base_url + "/concurrent.wav") for _ in range(5)])
+        assert len(set(paths)) == 1 and count_requests("/concurrent.wav") == 1
+        print("  并发请求合并为一次下载")
+
+        # 解码结果与文件一起持久化，重建索引后仍可读取
+        speech = np.linspace(-1, 1, 8000, dtype=np.float32)[None]
+        downloader.cache.store_speech(paths[0], speech)
+        reloaded = URLAudioCache(cache_dir, 64 * 1024)
+        assert reloaded.owns(paths[0])
+        assert np.array_equal(reloaded.load_speech(paths[0]), speech)
+        print("  解码结果跨进程复用")
+
+        # 超出容量时淘汰最久未使用的条目
+        assert downloader.cache.stats()["bytes"] <= 64 * 1024
+        assert downloader.cache.stats()["evictions"] >= 1
+        print("  超出容量时按LRU淘汰")
+    finally:
+        await downloader.close()
+
+def test_http_cache_policy():
+    """测试HTTP缓存策略"""
+    now = 1_700_000_000.0
+    assert http_cache_policy({"Cache-Control": "no-store, max-age=60"}, now) == (False, now)
+    assert http_cache_policy({"Cache-Control": "no-cache"}, now) == (True, now)
+    assert http_cache_policy({"Cache-Control": "public, max-age=60"}, now) == (True, now + 60)
+    assert http_cache_policy({"Cache-Control": "max-age=60", "Age": "20"}, now) == (True, now + 40)
+    assert http_cache_policy({"Cache-Control": "s-maxage=120, max-age=60"}, now) == (True, now + 120)
+    assert http_cache_policy({"Cache-Control": "max-age=abc"}, now) == (True, now)
+    print("  Cache-Control")
+
+    date = "Tue, 14 Nov 2023 22:13:20 GMT"  # 即now
+    assert http_cache_policy({"Date": date, "Expires": "Tue, 14 Nov 2023 23:13:20 GMT"}, now) == (True, now + 3600)
+    assert http_cache_policy({"Date": date, "Expires": "0"}, now) == (True, now)
+    # 启发式有效期：Last-Modified距今时长的10%，最多1天
+    assert http_cache_policy({"Date": date, "Last-Modified": "Tue, 14 Nov 2023 12:13:20 GMT"}, now) == (True, now + 3600)
+    assert http_cache_policy({"Date": date, "Last-Modified": "Tue, 14 Nov 2000 22:13:20 GMT"}, now) == (True, now + 86400)
+    assert http_cache_policy({}, now) == (True, now)
+    print("  Expires与启发式有效期")
+
+def test_url_cache():
+    """测试参考音频URL缓存"""
+    server, base_url = start_server()
+    cache_dir = tempfile.mkdtemp(prefix="url_cache_test_")
+    try:
+        asyncio.run(run_cache_tests(base_url, cache_dir))
+    finally:
+        server.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+def main():
+    """运行URL缓存测试"""
+    print("开始参考音频URL缓存测试")
+    try:
+        test_http_cache_policy()
+        test_url_cache()
+        print("URL缓存测试通过")
+    except AssertionError as e:
+        print(f"URL缓存测试失败: {e}")
+        raise
+
+if __name__ == "__main__":
+    main()
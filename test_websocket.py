@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+WebSocket会话测试脚本
+用模拟的WebSocket连接和TTS服务驱动WebSocketTTSSession，验证消息协议，不需要启动API服务和加载模型
+"""
+
+import asyncio
+import json
+
+import main as api
+from tts_service import check_stream_format
+
+class FakeTTSService:
+    """按请求文本返回固定音频块的TTS服务，记录收到的请求"""
+
+    def __init__(self, chunk_delay=0.0):
+        self.requests = []
+        self.chunk_delay = chunk_delay
+
+    def get_sample_rate(self):
+        return 22050
+
+    def check_stream_format(self, audio_format):
+        check_stream_format(audio_format, self.get_sample_rate())
+
+    async def synthesize_stream(self, request):
+        self.requests.append(request)
+        for index in range(2):
+            await asyncio.sleep(self.chunk_delay)
+            yield memoryview(f"{request.text}#{index}".encode("utf-8"))
+
+class FakeWebSocket:
+    """依次返回预设的客户端消息（dict为JSON文本帧，bytes为二进制帧），消息发完后断开连接"""
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.sent = []
+
+    async def receive(self):
+        # 消息之间留出间隔，让已启动的合成任务开始执行
+        await asyncio.sleep(0.02)
+        if not self.messages:
+            # 留出时间让在途合成完成
+            await asyncio.sleep(0.2)
+            return {"type": "websocket.disconnect", "code": 1000}
+        message = self.messages.pop(0)
+        if isinstance(message, bytes):
+            return {"type": "websocket.receive", "bytes": message}
+        return {"type": "websocket.receive", "text": json.dumps(message, ensure_ascii=False)}
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def send_bytes(self, data):
+        self.sent.append(bytes(data))
+
+async def run_session(messages):
+    websocket = FakeWebSocket(messages)
+    session = api.WebSocketTTSSession(websocket)
+    try:
+        await session.run()
+    except api.WebSocketDisconnect:
+        pass
+    finally:
+        await session.close()
+    return websocket.sent
+
+def run_with_service(service, messages):
+    original_service = api.tts_service
+    api.tts_service = service
+    try:
+        return asyncio.run(run_session(messages))
+    finally:
+        api.tts_service = original_service
+
+def control_messages(sent, message_type):
+    return [message for message in sent if isinstance(message, dict) and message.get("type") == message_type]
+
+def test_text_start_with_text():
+    """text_start携带的文本与text_delta一样参与合成"""
+    service = FakeTTSService()
+    sent = run_with_service(service, [
+        {"type": "text_start", "request_id": "t1", "text": "开头的一句话", "format": "pcm"},
+        {"type": "text_end", "request_id": "t1"},
+    ])
+
+    assert [request.text for request in service.requests] == ["开头的一句话"]
+    sentences = control_messages(sent, "sentence")
+    assert [message["text"] for message in sentences] == ["开头的一句话"]
+    chunks = control_messages(sent, "audio_chunk")
+    assert chunks, "text_start中的文本没有产生音频"
+    end = control_messages(sent, "end")
+    assert end and end[0]["sentences"] == 1 and end[0]["chunks"] == len(chunks)
+    print("  text_start携带的文本被合成")
+
+def test_numeric_request_id():
+    """数字request_id在追加文本和取消时与开始时的请求对应"""
+    service = FakeTTSService()
+    sent = run_with_service(service, [
+        {"type": "text_start", "request_id": 7, "format": "pcm"},
+        {"type": "text_delta", "request_id": 7, "text": "数字标识的文本流"},
+        {"type": "text_end", "request_id": 7},
+    ])
+    assert not control_messages(sent, "error"), control_messages(sent, "error")
+    assert [request.text for request in service.requests] == ["数字标识的文本流"]
+    assert [message["request_id"] for message in control_messages(sent, "end")] == ["7"]
+    print("  数字request_id的文本流")
+
+    service = FakeTTSService(chunk_delay=0.1)
+    sent = run_with_service(service, [
+        {"type": "synthesize", "request_id": 5, "text": "会被取消的请求", "format": "pcm"},
+        {"type": "cancel", "request_id": 5},
+    ])
+    assert [message["request_id"] for message in control_messages(sent, "cancelled")] == ["5"]
+    assert not control_messages(sent, "end")
+    print("  数字request_id的取消")
+
+def test_binary_frame():
+    """客户端发送二进制帧时返回错误消息，会话继续处理后续请求"""
+    service = FakeTTSService()
+    sent = run_with_service(service, [
+        b"\x00\x01\x02",
+        {"type": "synthesize", "request_id": "after", "text": "二进制帧之后的请求", "format": "pcm"},
+    ])
+    errors = control_messages(sent, "error")
+    assert len(errors) == 1 and "request_id" not in errors[0]
+    assert [message["request_id"] for message in control_messages(sent, "end")] == ["after"]
+    print("  二进制帧不会中断会话")
+
+def test_unsupported_stream_format():
+    """模型采样率不支持Opus时，请求在开始合成前被拒绝"""
+    service = FakeTTSService()
+    sent = run_with_service(service, [
+        {"type": "synthesize", "request_id": "o1", "text": "需要Opus格式", "format": "opus"},
+        {"type": "text_start", "request_id": "o2", "format": "opus"},
+    ])
+    errors = control_messages(sent, "error")
+    assert [message["request_id"] for message in errors] == ["o1", "o2"]
+    assert not service.requests and not control_messages(sent, "status")
+    print("  不支持的流式格式被拒绝")
+
+def main():
+    """运行WebSocket会话测试"""
+    print("开始WebSocket会话测试")
+    test_text_start_with_text()
+    test_numeric_request_id()
+    test_binary_frame()
+    test_unsupported_stream_format()
+    print("WebSocket会话测试通过")
+
+if __name__ == "__main__":
+    main()
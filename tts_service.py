@@ -11,15 +11,25 @@ import os
 import sys
 import uuid
 import tempfile
+import io
 import json
+import re
 import hashlib
 import mimetypes
+import email.utils
+import struct
+import mmap
+import threading
+import time
+import concurrent.futures
+import queue
+from abc import ABC, abstractmethod
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict, Optional, AsyncGenerator, Union, Any
+from typing import List, Dict, Optional, AsyncGenerator, Union, Any, Tuple
 from dataclasses import dataclass
 from enum import Enum
 import logging
-import librosa
 
 # 添加CosyVoice模块路径
 sys.path.append('CosyVoice')
@@ -28,6 +38,7 @@ sys.path.append('CosyVoice')
 import torch
 import torchaudio
 import numpy as np
+import soundfile
 
 # 网络请求
 import aiohttp
@@ -45,6 +56,8 @@ class AudioFormat(Enum):
     WAV = "wav"
     MP3 = "mp3"
     FLAC = "flac"
+    OPUS = "opus"  # Ogg容器封装的Opus
+    PCM = "pcm"  # 原始16位小端PCM (s16le)
 
 class SynthesisMode(Enum):
     """合成模式枚举"""
@@ -63,7 +76,7 @@ class TTSRequest:
                  format: AudioFormat = AudioFormat.WAV, sample_rate: int = None,
                  prompt_text: str = None, prompt_audio = None, instruct_text: str = None,
                  stream: bool = False, text_frontend: bool = True, zero_shot_spk_id: str = "",
-                 seed: int = None):
+                 seed: int = None, cancel_token: "CancelToken" = None):
         self.text = text
         self.mode = mode
         self.speaker = speaker
@@ -78,6 +91,7 @@ class TTSRequest:
         self.text_frontend = text_frontend
         self.zero_shot_spk_id = zero_shot_spk_id
         self.seed = seed
+        self.cancel_token = cancel_token or CancelToken()
 
 @dataclass
 class TTSResult:
@@ -93,21 +107,1609 @@ class TTSResult:
     mode_used: Optional[SynthesisMode] = None
     speaker_used: Optional[str] = None
 
+def wav_stream_header(sample_rate: int, channels: int = 1, bits_per_sample: int = 16) -> bytes:
+    """
+    生成流式WAV文件头
+    数据长度未知，RIFF/data长度字段填充为最大值，播放器会读取到流结束为止
+    """
+    byte_rate = sample_rate * channels * bits_per_sample // 8
+    block_align = channels * bits_per_sample // 8
+    return (
+        b'RIFF' + struct.pack('<I', 0xFFFFFFFF) + b'WAVE' +
+        b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, sample_rate,
+                              byte_rate, block_align, bits_per_sample) +
+        b'data' + struct.pack('<I', 0xFFFFFFFF)
+    )
+
+def silent_wav_bytes(sample_rate: int = 16000, seconds: float = 1.0) -> bytes:
+    """内存中生成的静音WAV文件，用作缺省参考音频"""
+    data_size = int(sample_rate * seconds) * 2
+    header = struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,
+        b'data', data_size
+    )
+    return header + bytes(data_size)
+
+class PCM16StreamEncoder:
+    """
+    流式PCM编码器
+    每个音频块在预分配、可复用的缓冲区中一次完成float→int16转换，返回memoryview，不产生中间张量。
+    返回的memoryview在下一次encode调用后即被覆盖，消费方必须在此之前发送或复制
+    """
+    
+    def __init__(self, initial_samples: int = 16384):
+        self._scratch = np.empty(initial_samples, dtype=np.float32)
+        self._pcm = np.empty(initial_samples, dtype=np.int16)
+    
+    def encode(self, audio_tensor: torch.Tensor) -> memoryview:
+        """将[-1, 1]范围的浮点音频块转换为s16le字节视图"""
+        samples = audio_tensor.detach()
+        if samples.device.type != 'cpu':
+            samples = samples.cpu()
+        source = samples.reshape(-1).numpy()
+        
+        count = source.shape[0]
+        if count > self._pcm.shape[0]:
+            self._scratch = np.empty(count, dtype=np.float32)
+            self._pcm = np.empty(count, dtype=np.int16)
+        
+        scratch = self._scratch[:count]
+        pcm = self._pcm[:count]
+        np.clip(source, -1.0, 1.0, out=scratch)
+        np.multiply(scratch, 32767.0, out=scratch)
+        np.copyto(pcm, scratch, casting='unsafe')
+        return memoryview(pcm).cast('B')
+
+# 各格式的流式媒体类型
+AUDIO_MEDIA_TYPES = {
+    AudioFormat.WAV: "audio/wav",
+    AudioFormat.MP3: "audio/mpeg",
+    AudioFormat.FLAC: "audio/flac",
+    AudioFormat.OPUS: "audio/ogg; codecs=opus",
+}
+
+# libsndfile编码参数；MP3使用恒定码率，流中没有Xing帧时解码器也能正确估算时长
+_SOUNDFILE_ENCODINGS = {
+    AudioFormat.WAV: {'format': 'WAV', 'subtype': 'PCM_16'},
+    AudioFormat.FLAC: {'format': 'FLAC', 'subtype': 'PCM_16'},
+    AudioFormat.MP3: {'format': 'MP3', 'subtype': 'MPEG_LAYER_III',
+                      'compression_level': 0.5, 'bitrate_mode': 'CONSTANT'},
+    AudioFormat.OPUS: {'format': 'OGG', 'subtype': 'OPUS'},
+}
+
+# Opus只支持这些采样率
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+# sndfile.h: SFC_SET_OGG_PAGE_LATENCY_MS
+_SFC_SET_OGG_PAGE_LATENCY_MS = 0x1302
+
+class _StreamSink:
+    """
+    供libsndfile写入的可寻址输出端
+    只保存尚未取走的字节。编码结束时回写到已发送区域的内容（FLAC的STREAMINFO、MP3的Xing帧）无法再修改，
+    直接丢弃，流式解码不依赖这些字段
+    """
+    
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+        self._sent = 0
+    
+    def write(self, data) -> int:
+        data = memoryview(data).cast('B')
+        size = len(data)
+        start = self._position - self._sent
+        if start < 0:
+            data = data[min(size, -start):]
+            start = 0
+        end = start + len(data)
+        if end > len(self._buffer):
+            self._buffer.extend(bytes(end - len(self._buffer)))
+        self._buffer[start:end] = data
+        self._position += size
+        return size
+    
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            self._position = offset
+        elif whence == os.SEEK_CUR:
+            self._position += offset
+        else:
+            self._position = self._sent + len(self._buffer) + offset
+        return self._position
+    
+    def tell(self) -> int:
+        return self._position
+    
+    def read(self, size: int = -1) -> bytes:
+        return b''
+    
+    def drain(self) -> bytes:
+        """取走目前为止产生的编码数据"""
+        data = bytes(self._buffer)
+        self._sent += len(data)
+        self._buffer.clear()
+        return data
+
+class AudioEncoder(ABC):
+    """
+    增量音频编码器
+    逐块接收[-1, 1]范围的浮点音频，返回本块新产生的编码数据；流式接口和文件输出共用。
+    调用顺序为start() → encode()/encode_pcm16() × N → finish()，中途放弃时调用close()
+    """
+    
+    # encode返回复用缓冲区上的视图，必须在事件循环中、发送前调用
+    zero_copy = False
+    
+    def start(self) -> bytes:
+        """流开头的文件头，没有则返回空"""
+        return b''
+    
+    @abstractmethod
+    def encode(self, audio_tensor: torch.Tensor) -> Union[bytes, memoryview]:
+        """编码一个浮点音频块"""
+    
+    @abstractmethod
+    def encode_pcm16(self, data: bytes) -> Union[bytes, memoryview]:
+        """编码s16le字节，用于把PCM格式的合成输出再编码"""
+    
+    def finish(self) -> bytes:
+        """结束编码，返回编码器缓存的剩余数据"""
+        return b''
+    
+    def close(self):
+        pass
+
+class PCMStreamEncoder(AudioEncoder):
+    """原始PCM和流式WAV：float→int16转换后直接输出，WAV在开头加一个长度未知的文件头"""
+    
+    zero_copy = True
+    
+    def __init__(self, sample_rate: int, wav_header: bool = False):
+        self.sample_rate = sample_rate
+        self.wav_header = wav_header
+        self._pcm = PCM16StreamEncoder()
+    
+    def start(self) -> bytes:
+        return wav_stream_header(self.sample_rate) if self.wav_header else b''
+    
+    def encode(self, audio_tensor: torch.Tensor) -> memoryview:
+        return self._pcm.encode(audio_tensor)
+    
+    def encode_pcm16(self, data: bytes) -> bytes:
+        return data
+
+class SoundFileEncoder(AudioEncoder):
+    """
+    基于libsndfile的编码器（WAV/FLAC/MP3/Ogg Opus）
+    output为空时编码到内存，每次encode返回新产生的字节；给出文件路径时直接写文件，结束时回填文件头
+    """
+    
+    def __init__(self, audio_format: AudioFormat, sample_rate: int, output: Optional[str] = None):
+        if audio_format == AudioFormat.OPUS and sample_rate not in OPUS_SAMPLE_RATES:
+            raise ValueError(f"Opus不支持采样率 {sample_rate}Hz")
+        self.audio_format = audio_format
+        self.sample_rate = sample_rate
+        self._sink = _StreamSink() if output is None else None
+        self._file = soundfile.SoundFile(
+            self._sink if output is None else output, 'w',
+            samplerate=sample_rate, channels=1, **_SOUNDFILE_ENCODINGS[audio_format]
+        )
+        if audio_format == AudioFormat.OPUS:
+            self._set_page_latency(100.0)
+    
+    def _set_page_latency(self, latency_ms: float):
+        """Ogg默认约1秒才输出一页，流式输出时缩短到100ms以降低首包延迟"""
+        try:
+            value = soundfile._ffi.new('double*', latency_ms)
+            soundfile._snd.sf_command(self._file._file, _SFC_SET_OGG_PAGE_LATENCY_MS,
+                                      value, soundfile._ffi.sizeof('double'))
+        except Exception as e:
+            logger.debug(f"设置Ogg页延迟失败: {e}")
+    
+    def _drain(self) -> bytes:
+        return self._sink.drain() if self._sink is not None else b''
+    
+    def encode(self, audio_tensor: torch.Tensor) -> bytes:
+        samples = audio_tensor.detach()
+        if samples.device.type != 'cpu':
+            samples = samples.cpu()
+        self._file.write(samples.reshape(-1).numpy().astype(np.float32, copy=False))
+        return self._drain()
+    
+    def encode_pcm16(self, data: bytes) -> bytes:
+        self._file.buffer_write(data, dtype='int16')
+        return self._drain()
+    
+    def finish(self) -> bytes:
+        self._file.close()
+        return self._drain()
+    
+    def close(self):
+        self._file.close()
+
+def check_stream_format(audio_format: AudioFormat, sample_rate: int):
+    """
+    检查流式输出格式能否按模型采样率编码
+    流式输出不做重采样，Opus只支持固定的几种采样率；不支持时在开始响应前抛出ValueError，避免发送文件头后才失败
+    """
+    if audio_format == AudioFormat.OPUS and sample_rate not in OPUS_SAMPLE_RATES:
+        raise ValueError(f"模型采样率 {sample_rate}Hz 不支持Opus流式输出，请改用其他格式")
+
+def create_stream_encoder(audio_format: AudioFormat, sample_rate: int) -> AudioEncoder:
+    """按输出格式创建流式编码器，WAV/PCM走零拷贝的PCM编码器，压缩格式交给libsndfile"""
+    if audio_format in (AudioFormat.WAV, AudioFormat.PCM):
+        return PCMStreamEncoder(sample_rate, wav_header=audio_format == AudioFormat.WAV)
+    return SoundFileEncoder(audio_format, sample_rate)
+
+class WSOLAStretcher:
+    """
+    流式WSOLA变速（不改变音高）
+    按输出步长Hs、输入步长Ha=Hs*speed截取加窗帧，每帧在±tolerance范围内搜索与上一帧的自然延续最相似的位置，
+    再以50%重叠相加输出。只缓存一帧加搜索范围的输入和一帧的重叠区，可逐块处理，内存占用与音频长度无关
+    """
+    
+    def __init__(self, speed: float, sample_rate: int, frame_ms: float = 30.0, tolerance_ms: float = 10.0):
+        self.speed = speed
+        self.frame = max(2, int(sample_rate * frame_ms / 1000) // 2 * 2)
+        self.hop_out = self.frame // 2
+        self.hop_in = self.hop_out * speed
+        self.tolerance = int(sample_rate * tolerance_ms / 1000)
+        # 周期汉宁窗在50%重叠时逐点相加恒为1
+        self.window = np.hanning(self.frame + 1)[:-1].astype(np.float32)
+        self._input = np.zeros(0, dtype=np.float32)
+        self._input_base = 0  # _input[0]在整段输入中的位置
+        self._input_total = 0
+        self._overlap = np.zeros(self.frame, dtype=np.float32)  # 从当前帧输出位置开始的重叠相加缓冲
+        self._frames = 0
+        self._previous = None  # 上一帧实际使用的输入位置
+        self._emitted = 0
+    
+    def _nominal(self, index: int) -> int:
+        return int(round(index * self.hop_in))
+    
+    def _ready(self) -> bool:
+        need = self._nominal(self._frames) + self.tolerance + self.frame
+        if self._previous is not None:
+            need = max(need, self._previous + self.hop_out + self.frame)
+        return need <= self._input_base + len(self._input)
+    
+    def _slice(self, position: int, length: int) -> np.ndarray:
+        start = position - self._input_base
+        return self._input[start:start + length]
+    
+    def _next_frame(self) -> np.ndarray:
+        nominal = self._nominal(self._frames)
+        if self._previous is None:
+            position = nominal
+        else:
+            # 在搜索范围内寻找与上一帧自然延续互相关最大的位置
+            template = self._slice(self._previous + self.hop_out, self.frame)
+            low = max(nominal - self.tolerance, self._input_base)
+            region = self._slice(low, nominal + self.tolerance + self.frame - low)
+            position = low + int(np.argmax(np.correlate(region, template, mode='valid')))
+        
+        self._overlap += self._slice(position, self.frame) * self.window
+        output = self._overlap[:self.hop_out].copy()
+        self._overlap[:self.hop_out] = self._overlap[self.hop_out:]
+        self._overlap[self.hop_out:] = 0.0
+        self._previous = position
+        self._frames += 1
+        
+        # 丢弃之后不会再用到的输入
+        keep_from = min(self._nominal(self._frames) - self.tolerance, position + self.hop_out)
+        drop = keep_from - self._input_base
+        if drop > 0:
+            self._input = self._input[drop:]
+            self._input_base += drop
+        return output
+    
+    def _drain(self, limit: Optional[int] = None) -> torch.Tensor:
+        outputs = []
+        produced = 0
+        while self._ready() and (limit is None or produced < limit):
+            frame = self._next_frame()
+            outputs.append(frame)
+            produced += len(frame)
+        audio = np.concatenate(outputs) if outputs else np.zeros(0, dtype=np.float32)
+        if limit is not None:
+            audio = audio[:limit]
+        self._emitted += len(audio)
+        return torch.from_numpy(audio).unsqueeze(0)
+    
+    def process(self, audio_tensor: torch.Tensor) -> torch.Tensor:
+        """输入一块音频，返回已可确定的变速输出（可能为空）"""
+        samples = audio_tensor.detach().reshape(-1).float().cpu().numpy()
+        self._input = np.concatenate([self._input, samples])
+        self._input_total += len(samples)
+        return self._drain()
+    
+    def flush(self) -> torch.Tensor:
+        """输入结束，补零处理剩余音频，总输出长度为输入长度/speed"""
+        padding = 2 * (self.frame + self.tolerance) + int(self.hop_in) + 1
+        self._input = np.concatenate([self._input, np.zeros(padding, dtype=np.float32)])
+        target = int(round(self._input_total / self.speed))
+        return self._drain(limit=max(0, target - self._emitted))
+
+class _WorkerError:
+    """工作线程异常的包装，用于跨线程传递给异步消费者"""
+    def __init__(self, error: BaseException):
+        self.error = error
+
+class SchedulerError(RuntimeError):
+    """推理调度错误基类，status_code为对应的HTTP状态码"""
+    status_code = 503
+
+class SchedulerBusyError(SchedulerError):
+    """推理准入队列已满，请求被快速拒绝"""
+    status_code = 503
+    retry_after = 1
+
+class InferenceTimeoutError(SchedulerError):
+    """请求超过截止时间仍未完成"""
+    status_code = 504
+
+class SynthesisCancelledError(SchedulerError):
+    """请求已被取消（客户端断开或主动停止）"""
+    status_code = 499
+
+class CancelToken:
+    """
+    协作式取消令牌
+    由事件循环一侧设置，推理线程在生成器的每个音频块和每个文本段之间检查，
+    取消后尽快停止推理并释放工作线程
+    """
+    
+    def __init__(self):
+        self._event = threading.Event()
+    
+    def cancel(self):
+        self._event.set()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+    
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise SynthesisCancelledError("合成请求已取消")
+
+class InferenceScheduler:
+    """
+    推理调度器
+    固定大小的推理线程池加有深度上限的准入队列：
+    队列满时立即拒绝，排队超过截止时间的任务在开始前直接丢弃
+    """
+    
+    def __init__(self, max_workers: int, max_queue_size: int, request_timeout: float):
+        self.max_workers = max(1, max_workers)
+        self.max_queue_size = max(0, max_queue_size)
+        self.request_timeout = request_timeout
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="cosyvoice-infer"
+        )
+        self._lock = threading.Lock()
+        self._in_flight = 0  # 排队中 + 执行中
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.cancelled = 0
+    
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue_size
+    
+    def check_capacity(self):
+        """检查是否还能接收新请求，用于在开始流式响应前快速拒绝"""
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self.rejected += 1
+                raise SchedulerBusyError(f"推理队列已满 ({self._in_flight}/{self.capacity})，请稍后重试")
+    
+    def submit(self, func, *args, deadline: Optional[float] = None,
+               cancel_token: Optional[CancelToken] = None) -> concurrent.futures.Future:
+        """
+        提交推理任务
+        deadline为time.monotonic()时刻，任务出队时已超过或已被取消则不再执行
+        """
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self.rejected += 1
+                raise SchedulerBusyError(f"推理队列已满 ({self._in_flight}/{self.capacity})，请稍后重试")
+            self._in_flight += 1
+        
+        def _job():
+            if cancel_token is not None and cancel_token.cancelled:
+                with self._lock:
+                    self.cancelled += 1
+                raise SynthesisCancelledError("请求在排队期间已取消")
+            if deadline is not None and time.monotonic() > deadline:
+                with self._lock:
+                    self.timed_out += 1
+                raise InferenceTimeoutError("请求排队超时")
+            return func(*args)
+        
+        future = self._executor.submit(_job)
+        future.add_done_callback(self._release)
+        return future
+    
+    def try_submit(self, func, *args) -> Optional[concurrent.futures.Future]:
+        """
+        只在有空闲推理线程时提交任务，否则立即返回None，不排队也不计入拒绝
+        用于流水线预取等可以退回顺序执行的工作，执行期间占用的线程计入并发上限
+        """
+        with self._lock:
+            if self._in_flight >= self.max_workers:
+                return None
+            self._in_flight += 1
+        
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(self._release_prefetch)
+        return future
+    
+    def _release_prefetch(self, future: concurrent.futures.Future):
+        with self._lock:
+            self._in_flight -= 1
+    
+    def _release(self, future: concurrent.futures.Future):
+        with self._lock:
+            self._in_flight -= 1
+            if not future.cancelled() and future.exception() is None:
+                self.completed += 1
+    
+    async def run(self, func, *args, timeout: Optional[float] = None,
+                  cancel_token: Optional[CancelToken] = None):
+        """
+        在推理线程池中执行func并等待结果，超过截止时间抛出InferenceTimeoutError
+        等待方被取消或超时时同时设置cancel_token，让仍在执行的推理尽快停止
+        """
+        timeout = timeout or self.request_timeout
+        future = self.submit(func, *args, deadline=time.monotonic() + timeout, cancel_token=cancel_token)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            if cancel_token is not None:
+                cancel_token.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise InferenceTimeoutError(f"推理超时 ({timeout}秒)")
+        except asyncio.CancelledError:
+            if cancel_token is not None:
+                cancel_token.cancel()
+            raise
+    
+    def stats(self) -> dict:
+        """调度器统计信息"""
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue_size": self.max_queue_size,
+                "in_flight": self._in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "cancelled": self.cancelled
+            }
+    
+    def shutdown(self):
+        """关闭线程池，丢弃尚未开始的任务"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+class SegmentAssembler:
+    """
+    合成片段拼接器
+    按文本长度的运行估计一次性预分配输出缓冲区，逐段写入，避免反复torch.cat拷贝
+    """
+    # 每个文本字符对应的输出采样点数（跨请求共享的运行估计）
+    _samples_per_char = 4000.0
+    _estimate_lock = threading.Lock()
+    _smoothing = 0.2
+    
+    def __init__(self, text_length: int):
+        self.text_length = max(int(text_length), 1)
+        self.capacity = int(self.text_length * SegmentAssembler._samples_per_char * 1.2)
+        self.length = 0
+        self.segment_count = 0
+        self._buffer: Optional[torch.Tensor] = None
+    
+    def append(self, segment: torch.Tensor):
+        """写入一个片段，容量不足时按1.5倍扩容"""
+        if segment.dim() == 1:
+            segment = segment.unsqueeze(0)
+        
+        required = self.length + segment.shape[1]
+        if self._buffer is None:
+            self.capacity = max(self.capacity, required)
+            self._buffer = torch.empty(
+                (segment.shape[0], self.capacity), dtype=segment.dtype, device=segment.device
+            )
+        elif required > self.capacity:
+            self.capacity = max(required, int(self.capacity * 1.5))
+            grown = torch.empty(
+                (self._buffer.shape[0], self.capacity), dtype=self._buffer.dtype, device=self._buffer.device
+            )
+            grown[:, :self.length].copy_(self._buffer[:, :self.length])
+            self._buffer = grown
+        
+        self._buffer[:, self.length:required].copy_(segment)
+        self.length = required
+        self.segment_count += 1
+    
+    def finish(self) -> torch.Tensor:
+        """返回拼接结果，并用实际长度更新运行估计"""
+        if self._buffer is None or self.length == 0:
+            raise ValueError("合成结果为空")
+        
+        observed = self.length / self.text_length
+        with SegmentAssembler._estimate_lock:
+            SegmentAssembler._samples_per_char += (
+                observed - SegmentAssembler._samples_per_char
+            ) * SegmentAssembler._smoothing
+        
+        return self._buffer[:, :self.length]
+
+def _nbytes(value) -> int:
+    """估算缓存值占用的字节数，支持张量及其容器"""
+    if isinstance(value, torch.Tensor):
+        return value.element_size() * value.nelement()
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v) for v in value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, torch.nn.Module):
+        return sum(_nbytes(buffer) for buffer in value.buffers())
+    return 0
+
+class ByteLRUCache:
+    """
+    按字节数限额的线程安全LRU缓存，可同时限制条目数
+    工作线程和事件循环都会访问，所有操作都在锁内完成
+    """
+    
+    def __init__(self, max_bytes: int, max_entries: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Any, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """读取缓存，命中时移动到最近使用端"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, key, value):
+        """写入缓存，超出字节限额时淘汰最久未使用的条目"""
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            
+            while self._entries and (
+                self.current_bytes > self.max_bytes or
+                (self.max_entries is not None and len(self._entries) > self.max_entries)
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+    
+    def contains(self, key) -> bool:
+        """是否已缓存，不影响命中统计和LRU顺序"""
+        with self._lock:
+            return key in self._entries
+    
+    def invalidate(self, key) -> bool:
+        """删除指定条目"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False
+            self.current_bytes -= entry[1]
+            return True
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def stats(self) -> dict:
+        """缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+class PromptAudioCache(ByteLRUCache):
+    """
+    参考音频缓存
+    以音频内容的SHA-256为键保存处理后的16kHz张量；
+    本地文件额外按(路径, mtime, 大小)记录摘要，未修改的文件无需重新读取计算哈希
+    """
+    
+    _max_path_entries = 4096
+    
+    def __init__(self, max_bytes: int):
+        super().__init__(max_bytes)
+        self._path_digests: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+    
+    def digest(self, source: Union[str, bytes, Path]) -> str:
+        """计算音频来源的内容摘要"""
+        if isinstance(source, (bytes, bytearray)):
+            return hashlib.sha256(source).hexdigest()
+        
+        path = os.path.abspath(str(source))
+        stat = os.stat(path)
+        path_key = (path, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._path_digests.get(path_key)
+            if digest is not None:
+                self._path_digests.move_to_end(path_key)
+                return digest
+        
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(block)
+        digest = sha256.hexdigest()
+        
+        with self._lock:
+            self._path_digests[path_key] = digest
+            while len(self._path_digests) > self._max_path_entries:
+                self._path_digests.popitem(last=False)
+        return digest
+    
+    def invalidate_source(self, source: Union[str, bytes, Path]) -> bool:
+        """按音频来源失效缓存：字节数据按内容摘要，路径则同时清除其所有版本"""
+        if isinstance(source, (bytes, bytearray)):
+            return self.invalidate(self.digest(source))
+        
+        path = os.path.abspath(str(source))
+        with self._lock:
+            stale = [key for key in self._path_digests if key[0] == path]
+            digests = {self._path_digests.pop(key) for key in stale}
+        
+        removed = False
+        for digest in digests:
+            removed = self.invalidate(digest) or removed
+        return removed
+    
+    def clear(self):
+        """清空缓存及路径索引"""
+        super().clear()
+        with self._lock:
+            self._path_digests.clear()
+
+# 重采样器缓存：torchaudio的Resample在构造时计算加窗sinc插值核，
+# 按(原采样率, 目标采样率, dtype, 设备)复用；前向计算只读取核，可在多个工作线程中同时使用
+_resampler_cache = ByteLRUCache(64 * 1024 * 1024, max_entries=32)
+
+def get_resampler(orig_sr: int, new_sr: int, dtype: torch.dtype = torch.float32,
+                  device: Union[str, torch.device] = 'cpu') -> torchaudio.transforms.Resample:
+    """获取缓存的重采样器，未命中时构造并放到指定设备上"""
+    key = (orig_sr, new_sr, dtype, str(device))
+    resampler = _resampler_cache.get(key)
+    if resampler is None:
+        resampler = torchaudio.transforms.Resample(orig_sr, new_sr, dtype=dtype).to(device)
+        _resampler_cache.put(key, resampler)
+    return resampler
+
+def resample_audio(waveform: torch.Tensor, orig_sr: int, new_sr: int) -> torch.Tensor:
+    """使用缓存的重采样器转换采样率"""
+    if orig_sr == new_sr:
+        return waveform
+    return get_resampler(orig_sr, new_sr, waveform.dtype, waveform.device)(waveform)
+
+class SpeakerFeatureStore:
+    """
+    说话人特征的紧凑存储，通过mmap按需读取
+    embeddings.f32为定长数组，每行依次存放llm_embedding和flow_embedding；
+    blobs.bin顺序追加变长的提示token和梅尔特征，位置（偏移、类型、形状）记录在注册表索引中。
+    文件只追加写入，读取一个说话人只访问它的那一行和那几段数据
+    """
+    
+    EMBEDDING_FILE = "embeddings.f32"
+    BLOB_FILE = "blobs.bin"
+    EMBEDDING_KEYS = ('llm_embedding', 'flow_embedding')
+    _HEADER = struct.Struct('<4sII')  # 魔数, 版本, 向量维度
+    _MAGIC = b'CVSE'
+    
+    def __init__(self, root: str):
+        self.root = root
+        self.embedding_path = os.path.join(root, self.EMBEDDING_FILE)
+        self.blob_path = os.path.join(root, self.BLOB_FILE)
+        self._lock = threading.Lock()
+        self._dim: Optional[int] = None
+        self._maps: Dict[str, mmap.mmap] = {}
+    
+    @property
+    def dim(self) -> Optional[int]:
+        """说话人向量维度，首次写入时确定"""
+        if self._dim is None and os.path.exists(self.embedding_path):
+            with open(self.embedding_path, 'rb') as f:
+                magic, _, dim = self._HEADER.unpack(f.read(self._HEADER.size))
+            if magic != self._MAGIC:
+                raise ValueError(f"无效的说话人向量文件: {self.embedding_path}")
+            self._dim = dim
+        return self._dim
+    
+    def _row_bytes(self) -> int:
+        return len(self.EMBEDDING_KEYS) * self.dim * 4
+    
+    def _append_row(self, row_values: np.ndarray) -> int:
+        if self.dim is None:
+            os.makedirs(self.root, exist_ok=True)
+            with open(self.embedding_path, 'wb') as f:
+                f.write(self._HEADER.pack(self._MAGIC, 1, row_values.size // len(self.EMBEDDING_KEYS)))
+            self._dim = row_values.size // len(self.EMBEDDING_KEYS)
+        if row_values.size != len(self.EMBEDDING_KEYS) * self.dim:
+            raise ValueError(f"说话人向量维度不匹配: {row_values.size} != {len(self.EMBEDDING_KEYS) * self.dim}")
+        
+        with open(self.embedding_path, 'r+b') as f:
+            size = f.seek(0, os.SEEK_END)
+            # 写入中断留下的不完整行被下一行覆盖
+            row = (size - self._HEADER.size) // self._row_bytes()
+            f.seek(self._HEADER.size + row * self._row_bytes())
+            f.write(row_values.astype('<f4').tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        return row
+    
+    def write(self, features: dict) -> dict:
+        """写入一个说话人的特征，返回记录在索引中的位置信息"""
+        location = {"blobs": {}, "values": {}}
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            with open(self.blob_path, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                for key, value in features.items():
+                    if key in self.EMBEDDING_KEYS:
+                        continue
+                    if isinstance(value, torch.Tensor):
+                        array = np.ascontiguousarray(value.detach().cpu().numpy())
+                        f.write(array.tobytes())
+                        location["blobs"][key] = [offset, array.dtype.str, list(array.shape)]
+                        offset += array.nbytes
+                    else:
+                        location["values"][key] = value
+                f.flush()
+                os.fsync(f.fileno())
+            
+            embeddings = [features.get(key) for key in self.EMBEDDING_KEYS]
+            if all(isinstance(value, torch.Tensor) for value in embeddings):
+                location["embedding_shape"] = list(embeddings[0].shape)
+                location["row"] = self._append_row(np.concatenate(
+                    [value.detach().cpu().float().numpy().reshape(-1) for value in embeddings]
+                ))
+        return location
+    
+    def _mapped(self, path: str, end: int) -> mmap.mmap:
+        """按需映射文件，文件增长超过已映射范围时重新映射"""
+        mapped = self._maps.get(path)
+        if mapped is None or len(mapped) < end:
+            if mapped is not None:
+                mapped.close()
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[path] = mapped
+        return mapped
+    
+    def read(self, location: dict) -> dict:
+        """按位置信息读取一个说话人的特征"""
+        features = dict(location.get("values", {}))
+        with self._lock:
+            for key, (offset, dtype, shape) in location.get("blobs", {}).items():
+                dtype = np.dtype(dtype)
+                count = int(np.prod(shape)) if shape else 1
+                mapped = self._mapped(self.blob_path, offset + count * dtype.itemsize)
+                array = np.frombuffer(mapped, dtype=dtype, count=count, offset=offset).reshape(shape)
+                features[key] = torch.from_numpy(array.copy())
+            
+            if "row" in location:
+                start = self._HEADER.size + location["row"] * self._row_bytes()
+                mapped = self._mapped(self.embedding_path, start + self._row_bytes())
+                row = np.frombuffer(mapped, dtype='<f4', count=len(self.EMBEDDING_KEYS) * self.dim, offset=start)
+                shape = location.get("embedding_shape", [1, self.dim])
+                for index, key in enumerate(self.EMBEDDING_KEYS):
+                    features[key] = torch.from_numpy(
+                        row[index * self.dim:(index + 1) * self.dim].reshape(shape).copy()
+                    )
+        return features
+    
+    def close(self):
+        with self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+    
+    def stats(self) -> dict:
+        """存储文件大小"""
+        return {
+            "embedding_dim": self.dim,
+            "embedding_bytes": os.path.getsize(self.embedding_path) if os.path.exists(self.embedding_path) else 0,
+            "blob_bytes": os.path.getsize(self.blob_path) if os.path.exists(self.blob_path) else 0
+        }
+
+class SpeakerRegistry:
+    """
+    持久化说话人注册表
+    index.jsonl为追加写的索引，每行一条put/delete记录，后写的记录覆盖先前的；
+    前端特征（提示token、梅尔特征、说话人向量）追加写入SpeakerFeatureStore，索引记录其位置。
+    索引在首次访问时读取，特征每次查询时从存储读取，
+    常用音色由引擎的热点缓存持有；添加说话人只需追加写入特征并追加一行索引
+    """
+    
+    INDEX_FILE = "index.jsonl"
+    
+    def __init__(self, root: str):
+        self.root = root
+        self.index_path = os.path.join(root, self.INDEX_FILE)
+        self.store = SpeakerFeatureStore(root)
+        self._lock = threading.RLock()
+        self._entries: Optional[Dict[str, dict]] = None
+        self._index_lines = 0
+        self.loads = 0
+    
+    def _ensure_index(self) -> Dict[str, dict]:
+        with self._lock:
+            if self._entries is not None:
+                return self._entries
+            
+            entries = {}
+            lines = 0
+            corrupted = False
+            if os.path.exists(self.index_path):
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            # 写入中断留下的半行，忽略
+                            logger.warning(f"忽略损坏的说话人索引记录: {line[:80]}")
+                            corrupted = True
+                            continue
+                        lines += 1
+                        if record.get("op") == "delete":
+                            entries.pop(record["id"], None)
+                        else:
+                            entries[record["id"]] = record
+            
+            self._entries = entries
+            self._index_lines = lines
+            if corrupted:
+                # 重写索引，避免后续追加的记录接在半行之后
+                self.compact()
+            if entries:
+                logger.info(f"加载说话人索引: {len(entries)} 个说话人")
+            return entries
+    
+    def _append_index(self, record: dict):
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._index_lines += 1
+    
+    def __contains__(self, speaker_id: str) -> bool:
+        return speaker_id in self._ensure_index()
+    
+    def __len__(self) -> int:
+        return len(self._ensure_index())
+    
+    def info(self, speaker_id: str) -> Optional[dict]:
+        """说话人元数据，只读索引"""
+        entry = self._ensure_index().get(speaker_id)
+        return dict(entry["meta"], speaker_id=speaker_id) if entry else None
+    
+    def list_speakers(self, kind: Optional[str] = None) -> List[dict]:
+        """列出说话人元数据，可按类型过滤"""
+        with self._lock:
+            entries = list(self._ensure_index().items())
+        return [
+            dict(entry["meta"], speaker_id=speaker_id)
+            for speaker_id, entry in entries
+            if kind is None or entry["meta"].get("kind") == kind
+        ]
+    
+    def get(self, speaker_id: str) -> Optional[dict]:
+        """从存储读取说话人的前端特征（CPU张量）"""
+        with self._lock:
+            entry = self._ensure_index().get(speaker_id)
+            if entry is None:
+                return None
+            features = self.store.read(entry["loc"])
+            self.loads += 1
+            return features
+    
+    def put(self, speaker_id: str, features: dict, **meta) -> dict:
+        """保存说话人特征：先追加写入特征数据，成功后再追加索引"""
+        features = {
+            key: value.detach().cpu() if isinstance(value, torch.Tensor) else value
+            for key, value in features.items()
+        }
+        embedding = features.get('llm_embedding')
+        meta = dict(meta, created_at=time.time())
+        if isinstance(embedding, torch.Tensor):
+            meta["embedding_shape"] = list(embedding.shape)
+        
+        with self._lock:
+            self._ensure_index()
+            record = {"op": "put", "id": speaker_id, "loc": self.store.write(features), "meta": meta}
+            self._append_index(record)
+            self._entries[speaker_id] = record
+            self._maybe_compact()
+        return dict(meta, speaker_id=speaker_id)
+    
+    def delete(self, speaker_id: str) -> bool:
+        """删除说话人：追加删除记录，存储文件中的数据只追加不回收"""
+        with self._lock:
+            if self._ensure_index().pop(speaker_id, None) is None:
+                return False
+            self._append_index({"op": "delete", "id": speaker_id})
+            self._maybe_compact()
+            return True
+    
+    def _maybe_compact(self):
+        """索引中的过期记录超过有效记录数时重写索引"""
+        if self._index_lines > 2 * len(self._entries) + 64:
+            self.compact()
+    
+    def compact(self):
+        """只保留每个说话人的最新记录，写临时文件后原子替换索引"""
+        with self._lock:
+            entries = self._ensure_index()
+            os.makedirs(self.root, exist_ok=True)
+            temp_path = f"{self.index_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for record in entries.values():
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.index_path)
+            self._index_lines = len(entries)
+    
+    def close(self):
+        """释放存储文件映射"""
+        self.store.close()
+    
+    def stats(self) -> dict:
+        """注册表统计信息"""
+        with self._lock:
+            return {
+                "speakers": len(self._entries) if self._entries is not None else None,
+                "record_loads": self.loads,
+                "index_lines": self._index_lines,
+                "store": self.store.stats()
+            }
+
+class TextSegmenter:
+    """
+    中英文分句器
+    按句末标点切分，过长的句子在逗号/空白处再切，朗读长度过短的片段并入前一句
+    """
+    _sentence_ends = set('。！？!?；;…\n')
+    _closing_marks = set('”’"\'）)」』】')
+    _clause_ends = set('，,、：: ')
+    # 中日韩文字一个字对应一个音节，朗读长度约相当于3个拉丁字母
+    _cjk_chars = re.compile('[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+    _cjk_weight = 3
+    
+    @classmethod
+    def spoken_length(cls, text: str) -> int:
+        """按文字种类估计的朗读长度，以拉丁字符为单位"""
+        return len(text) + (cls._cjk_weight - 1) * len(cls._cjk_chars.findall(text))
+    
+    @classmethod
+    def split(cls, text: str, max_chars: int = 120, min_chars: int = 8) -> List[str]:
+        """
+        将文本切分为适合逐句合成的片段
+        max_chars按字符数限制片段长度；min_chars按朗读长度判断过短的片段，"你好。"之类的短句才会并入前一句
+        """
+        sentences = []
+        start = 0
+        i = 0
+        while i < len(text):
+            ch = text[i]
+            # 英文句点仅在其后为空白或文本结尾时视为句末（避免切开小数）
+            is_end = ch in cls._sentence_ends or (
+                ch == '.' and (i + 1 == len(text) or text[i + 1].isspace())
+            )
+            i += 1
+            if is_end:
+                while i < len(text) and (text[i] in cls._closing_marks or text[i] in cls._sentence_ends):
+                    i += 1
+                sentences.append(text[start:i])
+                start = i
+        if start < len(text):
+            sentences.append(text[start:])
+        
+        pieces = []
+        for sentence in sentences:
+            sentence = sentence.strip()
+            if sentence:
+                pieces.extend(cls._split_long(sentence, max_chars))
+        
+        segments = []
+        for piece in pieces:
+            if (segments and cls.spoken_length(piece) < min_chars and
+                    len(segments[-1]) + len(piece) <= max_chars):
+                separator = ' ' if segments[-1][-1].isascii() and piece[0].isascii() else ''
+                segments[-1] = f"{segments[-1]}{separator}{piece}"
+            else:
+                segments.append(piece)
+        return segments
+    
+    @classmethod
+    def split_complete(cls, text: str, max_chars: int = 120) -> Tuple[List[str], str]:
+        """
+        增量文本切分，返回(已结束的句子, 未结束的剩余文本)
+        句末标点之后已出现后续字符才算确认结束，以便吸收右引号并区分小数点；
+        没有标点的剩余文本超过max_chars时在逗号/空白处强制切分
+        """
+        cut = 0
+        i = 0
+        while i < len(text):
+            ch = text[i]
+            i += 1
+            if ch not in cls._sentence_ends and ch != '.':
+                continue
+            
+            j = i
+            while j < len(text) and (text[j] in cls._closing_marks or text[j] in cls._sentence_ends):
+                j += 1
+            if j >= len(text):
+                break  # 等待更多输入
+            if ch == '.' and not (text[i].isspace() or text[i] in cls._closing_marks):
+                continue
+            cut = i = j
+        
+        sentences = cls.split(text[:cut], max_chars) if text[:cut].strip() else []
+        remainder = text[cut:]
+        if len(remainder) > max_chars:
+            pieces = cls._split_long(remainder.strip(), max_chars)
+            sentences.extend(pieces[:-1])
+            remainder = pieces[-1]
+        return sentences, remainder
+    
+    @classmethod
+    def _split_long(cls, sentence: str, max_chars: int) -> List[str]:
+        pieces = []
+        while len(sentence) > max_chars:
+            cut = max((sentence.rfind(mark, 0, max_chars) for mark in cls._clause_ends), default=-1)
+            if cut < max_chars // 2:
+                cut = max_chars - 1
+            pieces.append(sentence[:cut + 1].strip())
+            sentence = sentence[cut + 1:].strip()
+        if sentence:
+            pieces.append(sentence)
+        return pieces
+
+def _parse_http_date(value: Optional[str]) -> Optional[float]:
+    """解析HTTP日期头为时间戳，无法解析时返回None"""
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+def http_cache_policy(headers, now: Optional[float] = None) -> Tuple[bool, float]:
+    """
+    按RFC 9111计算响应的缓存策略，返回(是否可缓存, 过期时间戳)
+    优先级为Cache-Control的no-store/no-cache、s-maxage/max-age（扣除Age），其次Expires，
+    都没有时按Last-Modified距今时长的10%启发式估计，最多1天
+    """
+    now = time.time() if now is None else now
+    directives = {}
+    for part in headers.get('Cache-Control', '').split(','):
+        name, _, value = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"')
+    
+    if 'no-store' in directives:
+        return False, now
+    if 'no-cache' in directives:
+        return True, now
+    
+    for name in ('s-maxage', 'max-age'):
+        if name in directives:
+            try:
+                age = int(headers.get('Age', 0) or 0)
+                return True, now + max(0, int(directives[name]) - age)
+            except ValueError:
+                return True, now
+    
+    date = _parse_http_date(headers.get('Date')) or now
+    expires = _parse_http_date(headers.get('Expires'))
+    if 'Expires' in headers:
+        # 无法解析的Expires视为已过期
+        return True, (now + max(0.0, expires - date)) if expires is not None else now
+    
+    last_modified = _parse_http_date(headers.get('Last-Modified'))
+    if last_modified is not None and last_modified < date:
+        return True, now + min((date - last_modified) * 0.1, 86400.0)
+    return True, now
+
+class URLAudioCache:
+    """
+    参考音频URL磁盘缓存
+    按HTTP缓存语义保存下载的音频：新鲜期内直接使用本地文件，过期后凭ETag/Last-Modified发条件请求，304时只刷新有效期。
+    解码后的16kHz音频以.npy保存在同一目录，进程重启后也无需重新解码；总大小超过上限时按最近使用淘汰
+    """
+    
+    def __init__(self, root: str, max_bytes: int):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._revalidated = 0
+        self._misses = 0
+        self._evictions = 0
+        self._load()
+    
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+    
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+    
+    @staticmethod
+    def _entry_bytes(entry: dict) -> int:
+        return entry['size'] + entry.get('speech_size', 0)
+    
+    def _load(self):
+        """扫描缓存目录重建索引，文件缺失或元数据损坏的条目直接删除"""
+        entries = []
+        for name in os.listdir(self.root):
+            if name.endswith('.tmp'):
+                self._unlink(name)
+                continue
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(self._path(name), 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+                if not os.path.exists(self._path(entry['file'])):
+                    raise FileNotFoundError(entry['file'])
+                if entry.get('speech') and not os.path.exists(self._path(entry['speech'])):
+                    entry.pop('speech')
+                    entry.pop('speech_size', None)
+                entries.append(entry)
+            except Exception as e:
+                logger.warning(f"丢弃损坏的URL缓存条目 {name}: {e}")
+                self._unlink(name)
+        
+        for entry in sorted(entries, key=lambda item: item.get('accessed', 0)):
+            self._entries[entry['key']] = entry
+            self._total_bytes += self._entry_bytes(entry)
+        self._evict()
+    
+    def _unlink(self, name: Optional[str]):
+        if not name:
+            return
+        try:
+            os.unlink(self._path(name))
+        except FileNotFoundError:
+            pass
+    
+    def _write_meta(self, entry: dict):
+        meta_path = self._path(entry['key'] + '.json')
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(meta_path + '.tmp', meta_path)
+    
+    def lookup(self, url: str) -> Optional[dict]:
+        """查找URL对应的缓存条目，返回副本"""
+        key = self.key(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if not os.path.exists(self._path(entry['file'])):
+                # 文件被外部删除，视为未缓存
+                self._remove(key)
+                return None
+            return dict(entry)
+    
+    def fresh_path(self, url: str) -> Optional[str]:
+        """条目仍在新鲜期内时返回本地文件路径，不需要任何网络请求"""
+        entry = self.lookup(url)
+        if entry is None or time.time() >= entry['expires']:
+            return None
+        self._touch(entry['key'])
+        self._hits += 1
+        return self._path(entry['file'])
+    
+    @staticmethod
+    def conditional_headers(entry: Optional[dict]) -> dict:
+        """根据缓存条目生成条件请求头"""
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+    
+    def revalidated(self, url: str, headers) -> Optional[str]:
+        """
+        服务器返回304：刷新有效期和校验值，继续使用本地文件
+        304响应带no-store时删除条目并返回None，调用方需重新下载
+        """
+        key = self.key(url)
+        cacheable, expires = http_cache_policy(headers)
+        with self._lock:
+            if not cacheable:
+                self._remove(key)
+                return None
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry['expires'] = expires
+            entry['etag'] = headers.get('ETag') or entry.get('etag')
+            entry['last_modified'] = headers.get('Last-Modified') or entry.get('last_modified')
+            entry['accessed'] = time.time()
+            self._entries.move_to_end(key)
+            self._write_meta(entry)
+            path = self._path(entry['file'])
+        self._revalidated += 1
+        return path
+    
+    def staging_path(self, url: str) -> str:
+        """下载中的临时文件，与缓存文件位于同一目录以便原子替换"""
+        return self._path(f"{self.key(url)}.{uuid.uuid4().hex}.tmp")
+    
+    def store(self, url: str, staging_path: str, headers, extension: str) -> str:
+        """将下载完成的文件放入缓存，替换该URL的旧版本及其解码结果"""
+        key = self.key(url)
+        _, expires = http_cache_policy(headers)
+        entry = {
+            'key': key,
+            'url': url,
+            'file': key + extension,
+            'size': os.path.getsize(staging_path),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'expires': expires,
+            'accessed': time.time()
+        }
+        with self._lock:
+            self._remove(key)
+            os.replace(staging_path, self._path(entry['file']))
+            self._write_meta(entry)
+            self._entries[key] = entry
+            self._total_bytes += entry['size']
+            self._evict(keep=key)
+        self._misses += 1
+        return self._path(entry['file'])
+    
+    def _touch(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry['accessed'] = time.time()
+                self._entries.move_to_end(key)
+    
+    def _remove(self, key: str):
+        """删除条目及其文件，调用方持有锁"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._total_bytes -= self._entry_bytes(entry)
+        self._unlink(entry['file'])
+        self._unlink(entry.get('speech'))
+        self._unlink(key + '.json')
+    
+    def _evict(self, keep: Optional[str] = None):
+        """超出容量时淘汰最久未使用的条目，调用方持有锁（初始化时除外）"""
+        for key in list(self._entries):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if key != keep:
+                self._remove(key)
+                self._evictions += 1
+    
+    def _entry_for_path(self, path: str) -> Optional[dict]:
+        path = os.path.abspath(str(path))
+        if os.path.dirname(path) != self.root:
+            return None
+        key = os.path.basename(path).split('.', 1)[0]
+        entry = self._entries.get(key)
+        if entry is None or entry['file'] != os.path.basename(path):
+            return None
+        return entry
+    
+    def owns(self, path: str) -> bool:
+        """路径是否为缓存管理的文件（调用方不应删除）"""
+        with self._lock:
+            return self._entry_for_path(path) is not None
+    
+    def load_speech(self, path: str) -> Optional[np.ndarray]:
+        """读取缓存文件对应的16kHz解码结果"""
+        with self._lock:
+            entry = self._entry_for_path(path)
+            speech = entry.get('speech') if entry is not None else None
+        if speech is None:
+            return None
+        try:
+            return np.load(self._path(speech))
+        except Exception as e:
+            logger.warning(f"读取URL缓存解码结果失败: {e}")
+            return None
+    
+    def store_speech(self, path: str, speech: np.ndarray):
+        """保存缓存文件解码后的16kHz音频"""
+        with self._lock:
+            entry = self._entry_for_path(path)
+            if entry is None:
+                return
+            name = entry['key'] + '.16k.npy'
+            staging = self._path(name + '.tmp')
+            with open(staging, 'wb') as f:
+                np.save(f, speech)
+            os.replace(staging, self._path(name))
+            self._total_bytes -= entry.get('speech_size', 0)
+            entry['speech'] = name
+            entry['speech_size'] = os.path.getsize(self._path(name))
+            self._total_bytes += entry['speech_size']
+            self._write_meta(entry)
+            self._evict(keep=entry['key'])
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "revalidated": self._revalidated,
+                "misses": self._misses,
+                "evictions": self._evictions
+            }
+
+class AudioDownloader:
+    """
+    参考音频下载器
+    持有一个共享的aiohttp会话：连接池按主机限制连接数并保持长连接，DNS结果缓存复用，
+    同一CDN上的重复下载不再重新建连和握手。会话在首次下载时创建，服务关闭时释放。
+    配置了URLAudioCache时按HTTP缓存语义复用已下载的文件，同一URL的并发请求只下载一次
+    """
+    
+    def __init__(self, max_bytes: int, total_timeout: float = 30.0, connect_timeout: float = 5.0,
+                 max_connections: int = 64, max_connections_per_host: int = 8,
+                 keepalive_timeout: float = 60.0, chunk_size: int = 64 * 1024,
+                 cache: Optional[URLAudioCache] = None):
+        self.max_bytes = max_bytes
+        self.total_timeout = total_timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._downloads = 0
+        self._rejected = 0
+    
+    # 不可缓存的响应下载到的临时文件，所有下载器（包括一次性下载器）共享，只有登记过的文件会被删除
+    _temp_files = set()
+    _temp_files_lock = threading.Lock()
+    
+    @classmethod
+    def _create_temp_file(cls, extension: str) -> str:
+        temp_file = tempfile.NamedTemporaryFile(suffix=extension, delete=False)
+        temp_file.close()
+        with cls._temp_files_lock:
+            cls._temp_files.add(temp_file.name)
+        return temp_file.name
+    
+    @classmethod
+    def discard_temp_file(cls, path: str) -> bool:
+        """删除下载产生的临时文件，不是下载临时文件的路径（本地文件、URL缓存文件）不做任何操作"""
+        with cls._temp_files_lock:
+            if path not in cls._temp_files:
+                return False
+            cls._temp_files.discard(path)
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        return True
+    
+    @classmethod
+    def from_config(cls, config, use_cache: bool = True) -> 'AudioDownloader':
+        api = config.api
+        cache = None
+        if use_cache:
+            cache = URLAudioCache(os.path.join(config.file.temp_dir, "url_cache"), config.file.url_cache_max_bytes)
+        return cls(
+            max_bytes=api.max_file_size,
+            total_timeout=api.download_timeout,
+            connect_timeout=api.download_connect_timeout,
+            max_connections=api.download_max_connections,
+            max_connections_per_host=api.download_max_connections_per_host,
+            keepalive_timeout=api.download_keepalive_timeout,
+            cache=cache
+        )
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        # aiohttp会话需在事件循环内创建，因此延迟到第一次下载
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.total_timeout, connect=self.connect_timeout)
+            )
+        return self._session
+    
+    async def download(self, url: str) -> str:
+        """
+        返回URL对应的本地文件路径
+        缓存命中时直接返回缓存文件（调用方不应删除），否则下载到临时文件；同一URL的并发下载合并为一次
+        """
+        if self.cache is None:
+            return await self._fetch(url)
+        
+        path = self.cache.fresh_path(url)
+        if path is not None:
+            return path
+        
+        task = self._inflight.get(url)
+        owner = task is None
+        if owner:
+            task = asyncio.ensure_future(self._fetch(url))
+            self._inflight[url] = task
+            task.add_done_callback(lambda done: self._download_done(url, done))
+        
+        # 等待方被取消时下载继续进行，结果仍会写入缓存
+        path = await asyncio.shield(task)
+        if owner or self.cache.owns(path):
+            return path
+        # 不可缓存的响应是发起方独占的临时文件，其余等待方各自下载
+        return await self._fetch(url)
+    
+    def _download_done(self, url: str, task: asyncio.Future):
+        self._inflight.pop(url, None)
+        if not task.cancelled():
+            # 取走异常，避免所有等待方都已离开时产生未处理异常的警告
+            task.exception()
+    
+    async def _fetch(self, url: str) -> str:
+        """发起（条件）请求并保存响应"""
+        entry = self.cache.lookup(url) if self.cache is not None else None
+        session = self._get_session()
+        async with session.get(url, headers=URLAudioCache.conditional_headers(entry)) as response:
+            if response.status == 304 and entry is not None:
+                path = self.cache.revalidated(url, response.headers)
+                if path is not None:
+                    logger.info(f"参考音频未变化，使用缓存: {url}")
+                    return path
+            else:
+                return await self._save_response(url, response)
+        
+        # 304响应不允许继续缓存，条目已删除，重新发起无条件请求获取内容
+        return await self._fetch(url)
+    
+    async def _save_response(self, url: str, response) -> str:
+        """保存200响应：可缓存的放入URL缓存，否则写入登记过的临时文件"""
+        if response.status != 200:
+            raise ValueError(f"下载失败: HTTP {response.status}")
+        
+        if response.content_length is not None and response.content_length > self.max_bytes:
+            self._rejected += 1
+            raise ValueError(f"音频文件过大: {response.content_length} 字节，上限 {self.max_bytes} 字节")
+        
+        # 从Content-Type推断文件扩展名
+        content_type = response.headers.get('content-type', '')
+        extension = mimetypes.guess_extension(content_type) or '.wav'
+        
+        cacheable = self.cache is not None and http_cache_policy(response.headers)[0]
+        target = self.cache.staging_path(url) if cacheable else self._create_temp_file(extension)
+        try:
+            received = await self._save_body(response, target)
+        except BaseException:
+            self.discard_temp_file(target)
+            raise
+        
+        self._downloads += 1
+        if cacheable:
+            target = self.cache.store(url, target, response.headers, extension)
+        logger.info(f"音频下载成功: {url} -> {target} ({received} 字节)")
+        return target
+    
+    async def _save_body(self, response, path: str) -> int:
+        """边下载边写文件并检查大小，超过max_bytes立即中止并删除文件"""
+        received = 0
+        try:
+            async with aiofiles.open(path, 'wb') as f:
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    received += len(chunk)
+                    if received > self.max_bytes:
+                        self._rejected += 1
+                        raise ValueError(f"音频文件过大: 超过上限 {self.max_bytes} 字节")
+                    await f.write(chunk)
+        except BaseException:
+            os.unlink(path)
+            raise
+        return received
+    
+    async def close(self):
+        """关闭会话，释放连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    def stats(self) -> dict:
+        return {
+            "downloads": self._downloads,
+            "rejected": self._rejected,
+            "session_open": self._session is not None and not self._session.closed,
+            "max_connections_per_host": self.max_connections_per_host,
+            "cache": self.cache.stats() if self.cache is not None else None
+        }
+
 class AudioFileHandler:
     """音频文件处理器"""
     
     @staticmethod
-    async def process_audio_input(audio_input: Union[str, bytes, Path]) -> str:
+    async def process_audio_input(audio_input: Union[str, bytes, Path],
+                                  downloader: Optional[AudioDownloader] = None) -> Union[str, bytes]:
         """
-        处理音频输入，统一转换为本地文件路径
-        支持: 本地文件路径、网络URL、字节数据
+        处理音频输入，统一转换为可直接解码的来源
+        支持: 本地文件路径、网络URL、字节数据；网络URL通过downloader的共享连接池下载，
+        字节数据原样返回，在内存中解码，不写临时文件
         """
         if isinstance(audio_input, (str, Path)):
             audio_path = str(audio_input)
             
             # 检查是否为网络URL
             if audio_path.startswith(('http://', 'https://')):
-                return await AudioFileHandler._download_audio(audio_path)
+                return await AudioFileHandler._download_audio(audio_path, downloader)
             
             # 检查是否为本地文件
             elif os.path.exists(audio_path):
@@ -117,57 +1719,67 @@ class AudioFileHandler:
                 raise ValueError(f"音频文件不存在: {audio_path}")
         
         elif isinstance(audio_input, bytes):
-            return await AudioFileHandler._save_audio_bytes(audio_input)
+            return audio_input
         
         else:
             raise ValueError(f"不支持的音频输入类型: {type(audio_input)}")
 
     @staticmethod
-    async def _download_audio(url: str) -> str:
-        """下载网络音频文件"""
+    async def _download_audio(url: str, downloader: Optional[AudioDownloader] = None) -> str:
+        """下载网络音频文件，未提供共享下载器时使用一次性的会话"""
+        owned = downloader is None
+        if owned:
+            downloader = AudioDownloader.from_config(get_config(), use_cache=False)
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        # 从URL或Content-Type推断文件扩展名
-                        content_type = response.headers.get('content-type', '')
-                        extension = mimetypes.guess_extension(content_type) or '.wav'
-                        
-                        # 创建临时文件
-                        temp_file = tempfile.NamedTemporaryFile(suffix=extension, delete=False)
-                        async with aiofiles.open(temp_file.name, 'wb') as f:
-                            async for chunk in response.content.iter_chunked(8192):
-                                await f.write(chunk)
-                        
-                        logger.info(f"音频下载成功: {url} -> {temp_file.name}")
-                        return temp_file.name
-                    else:
-                        raise ValueError(f"下载失败: HTTP {response.status}")
+            return await downloader.download(url)
         except Exception as e:
             raise ValueError(f"音频下载失败: {e}")
+        finally:
+            if owned:
+                await downloader.close()
 
     @staticmethod
-    async def _save_audio_bytes(audio_data: bytes) -> str:
-        """保存音频字节数据到临时文件"""
-        temp_file = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-        async with aiofiles.open(temp_file.name, 'wb') as f:
-            await f.write(audio_data)
-        
-        logger.info(f"音频数据保存成功: {len(audio_data)} 字节 -> {temp_file.name}")
-        return temp_file.name
+    def discard_temp_file(source: Union[str, bytes, None]):
+        """删除process_audio_input下载产生的临时文件；字节数据、本地文件和URL缓存文件不受影响"""
+        if isinstance(source, str):
+            AudioDownloader.discard_temp_file(source)
+
+    @staticmethod
+    def decode_audio(source: Union[str, bytes]) -> Tuple[torch.Tensor, int]:
+        """
+        解码音频为[通道, 采样点]的float32张量
+        字节数据通过BytesIO在内存中解码（WAV/FLAC/OGG/MP3），不经过文件系统
+        """
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        data, sample_rate = soundfile.read(source, dtype='float32', always_2d=True)
+        return torch.from_numpy(data.T), sample_rate
+
+    @staticmethod
+    def probe_audio(source: Union[str, bytes]):
+        """只读取文件头，返回采样点数、采样率和通道数等信息，不解码音频数据"""
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        return soundfile.info(source)
 
     @staticmethod
-    def validate_audio_file(file_path: str) -> bool:
-        """验证音频文件格式和质量"""
+    def validate_audio_file(file_path: Union[str, bytes], target_sr: int = 16000) -> bool:
+        """
+        验证音频文件格式和质量
+        只读取文件头判断，无法解析、没有音频数据或采样率低于target_sr的输入在解码前即被拒绝
+        """
         try:
-            waveform, sample_rate = torchaudio.load(file_path)
+            info = AudioFileHandler.probe_audio(file_path)
             
             # 检查基本参数
-            if waveform.numel() == 0:
+            if info.frames <= 0 or info.channels <= 0:
+                return False
+            if info.samplerate < target_sr:
+                logger.error(f"音频采样率过低: {info.samplerate}Hz，至少需要 {target_sr}Hz")
                 return False
             
             # 检查时长 (建议3-30秒)
-            duration = waveform.shape[1] / sample_rate
+            duration = info.frames / info.samplerate
             if not (1.0 <= duration <= 60.0):
                 logger.warning(f"音频时长异常: {duration:.2f}秒")
             
@@ -177,42 +1789,73 @@ class AudioFileHandler:
             return False
 
     @staticmethod
-    def load_wav(wav_path: str, target_sr: int = 16000):
+    def load_wav(wav_path: Union[str, bytes], target_sr: int = 16000):
         """
         加载音频文件 - 使用官方CosyVoice的方法
         参考: CosyVoice/cosyvoice/utils/file_utils.py::load_wav
         """
         try:
-            import torchaudio
-            
-            speech, sample_rate = torchaudio.load(wav_path, backend='soundfile')
+            speech, sample_rate = AudioFileHandler.decode_audio(wav_path)
             speech = speech.mean(dim=0, keepdim=True)
             if sample_rate != target_sr:
                 assert sample_rate > target_sr, f'wav sample rate {sample_rate} must be greater than {target_sr}'
-                speech = torchaudio.transforms.Resample(orig_freq=sample_rate, new_freq=target_sr)(speech)
+                speech = resample_audio(speech, sample_rate, target_sr)
             return speech
             
         except Exception as e:
             logger.error(f"音频文件加载失败: {e}")
             raise ValueError(f"音频文件加载失败: {str(e)}")
 
+    @staticmethod
+    def trim_silence(speech: torch.Tensor, top_db: float = 60, frame_length: int = 2048,
+                     hop_length: int = 512) -> torch.Tensor:
+        """
+        去除首尾静音，结果与librosa.effects.trim（ref=np.max）一致
+        帧能量由unfold视图一次向量化求出，用能量比值代替分贝换算；返回原张量的切片视图，不复制音频数据
+        """
+        mono = speech[0] if speech.dim() > 1 and speech.shape[0] == 1 else (
+            speech.mean(dim=0) if speech.dim() > 1 else speech
+        )
+        # 与librosa的center=True一致：两端各补frame_length//2个零，补零后的新张量可原地平方
+        padded = torch.nn.functional.pad(mono, (frame_length // 2, frame_length // 2))
+        power = padded.square_().unfold(0, frame_length, hop_length).mean(dim=-1)
+        
+        # 10*log10(max(amin, p)) - 10*log10(max(amin, ref)) > -top_db
+        amin = 1e-10
+        threshold = max(float(power.max()), amin) * 10.0 ** (-top_db / 10.0)
+        frames = torch.nonzero(power.clamp_min_(amin) > threshold)
+        if frames.numel() == 0:
+            return speech[..., :0]
+        
+        start = int(frames[0]) * hop_length
+        end = min(speech.shape[-1], (int(frames[-1]) + 1) * hop_length)
+        return speech[..., start:end]
+
     @staticmethod
     def postprocess(speech, top_db=60, hop_length=220, win_length=440, max_val=0.8):
         """
-        音频后处理 - 使用官方CosyVoice的方法
+        音频后处理 - 与官方CosyVoice的方法一致：去除首尾静音后峰值归一化
         参考: CosyVoice/webui.py::postprocess
+        去掉了静音时把保留的部分复制为独立张量，缓存结果时不会连带持有未裁剪的原始数据；
+        归一化原地进行，没有裁剪时传入的张量会被修改
         """
         try:
-            import librosa
-            import torch
-            
-            speech, _ = librosa.effects.trim(
+            length = speech.shape[-1]
+            speech = AudioFileHandler.trim_silence(
                 speech, top_db=top_db,
                 frame_length=win_length,
                 hop_length=hop_length
             )
-            if speech.abs().max() > max_val:
-                speech = speech / speech.abs().max() * max_val
+            if speech.numel() == 0:
+                raise ValueError("参考音频全部为静音")
+            if speech.shape[-1] < length:
+                speech = speech.clone()
+            
+            # 一次遍历同时得到最小值和最大值，不生成abs()中间张量
+            low, high = torch.aminmax(speech)
+            peak = max(-float(low), float(high))
+            if peak > max_val:
+                speech.mul_(max_val / peak)
             
             # 注意：这里不添加尾部静音，因为我们是用作参考音频
             return speech
@@ -222,7 +1865,7 @@ class AudioFileHandler:
             raise ValueError(f"音频后处理失败: {str(e)}")
 
     @staticmethod
-    def load_audio_data(file_path: str, target_sample_rate: int = 16000):
+    def load_audio_data(file_path: Union[str, bytes], target_sample_rate: int = 16000):
         """加载并处理音频文件为CosyVoice2期望的格式"""
         try:
             # 使用官方的方法加载音频
@@ -240,6 +1883,15 @@ class AudioFileHandler:
 class CosyVoice2Engine:
     """CosyVoice2 引擎 - 专门优化的高性能实现"""
     
+    # 使用已保存音色时各合成模式对应的推理方式
+    _SAVED_SPEAKER_MODES = {
+        SynthesisMode.BASIC: SynthesisMode.ZERO_SHOT,
+        SynthesisMode.ZERO_SHOT: SynthesisMode.ZERO_SHOT,
+        SynthesisMode.CROSS_LINGUAL: SynthesisMode.CROSS_LINGUAL,
+        SynthesisMode.INSTRUCT: SynthesisMode.INSTRUCT2,
+        SynthesisMode.INSTRUCT2: SynthesisMode.INSTRUCT2
+    }
+    
     def __init__(self):
         self.config = get_config()
         self.cosyvoice = None
@@ -253,8 +1905,25 @@ class CosyVoice2Engine:
         }
         
         # 性能优化
-        self._audio_cache = {}  # 音频缓存
-        self._speaker_cache = {}  # 说话人特征缓存
+        self._audio_cache = PromptAudioCache(self.config.cosyvoice.prompt_cache_max_bytes)  # 参考音频缓存
+        self._speaker_cache = ByteLRUCache(self.config.cosyvoice.speaker_cache_max_bytes)  # 说话人前端特征缓存
+        self.speakers = SpeakerRegistry(self.config.file.speaker_dir)  # 已保存的说话人
+        self._speaker_contexts = ByteLRUCache(  # 常用音色的设备端特征
+            self.config.cosyvoice.speaker_hot_cache_max_bytes,
+            max_entries=self.config.cosyvoice.speaker_hot_cache_size
+        )
+        self._prefetching = set()
+        self._prefetch_tasks = set()  # 持有后台预取任务的引用，完成后移除
+        self._default_voices: Dict[str, dict] = {}  # 内置默认音色的设备端特征
+        self._default_voices_lock = threading.Lock()
+        self.downloader = AudioDownloader.from_config(self.config)  # 参考音频URL下载（共享连接池）
+        
+        # 推理调度
+        self.scheduler = InferenceScheduler(
+            max_workers=self.config.cosyvoice.max_concurrent_requests,
+            max_queue_size=self.config.cosyvoice.max_queue_size,
+            request_timeout=self.config.cosyvoice.request_timeout
+        )
     
     async def initialize(self) -> bool:
         """初始化CosyVoice2引擎"""
@@ -278,6 +1947,9 @@ class CosyVoice2Engine:
             # 检测模型能力
             self._detect_capabilities()
             
+            # 预处理默认音色，基础合成请求不再读取参考音频
+            await asyncio.get_event_loop().run_in_executor(None, self._prepare_default_voices)
+            
             self.is_initialized = True
             logger.info("✅ CosyVoice2引擎初始化成功")
             logger.info(f"🎯 支持的功能: {list(k for k, v in self.capabilities.items() if v)}")
@@ -312,14 +1984,23 @@ class CosyVoice2Engine:
             )
         
         request_id = str(uuid.uuid4())
+        self._start_speaker_prefetch(request)
         
         try:
+            # 已保存音色直接使用存储的前端特征，不经过参考音频处理
+            if request.zero_shot_spk_id and request.mode in self._SAVED_SPEAKER_MODES:
+                return await self._saved_speaker_synthesis(request, request_id)
+            
             # 处理参考音频
             if request.prompt_audio:
-                prompt_audio_path = await AudioFileHandler.process_audio_input(request.prompt_audio)
+                prompt_audio_path = await AudioFileHandler.process_audio_input(request.prompt_audio, self.downloader)
                 
-                # 验证音频文件
-                if not AudioFileHandler.validate_audio_file(prompt_audio_path):
+                # 验证音频文件（计算摘要和读取文件头都在线程池中进行，不阻塞事件循环）
+                valid = await asyncio.get_event_loop().run_in_executor(
+                    None, self._validate_prompt, prompt_audio_path
+                )
+                if not valid:
+                    AudioFileHandler.discard_temp_file(prompt_audio_path)
                     return TTSResult(
                         success=False,
                         error_message="参考音频文件格式无效",
@@ -349,14 +2030,12 @@ class CosyVoice2Engine:
                 )
             
             # 清理临时文件
-            if prompt_audio_path and prompt_audio_path.startswith(tempfile.gettempdir()):
-                try:
-                    os.unlink(prompt_audio_path)
-                except:
-                    pass
+            AudioFileHandler.discard_temp_file(prompt_audio_path)
             
             return result
             
+        except SchedulerError:
+            raise
         except Exception as e:
             logger.error(f"合成失败: {e}")
             return TTSResult(
@@ -365,6 +2044,42 @@ class CosyVoice2Engine:
                 request_id=request_id
             )
     
+    async def _saved_speaker_synthesis(self, request: TTSRequest, request_id: str) -> TTSResult:
+        """已保存音色合成 - 只传递zero_shot_spk_id，不读取也不处理任何参考音频"""
+        mode = self._saved_speaker_mode(request)
+        
+        def _synthesize():
+            outputs = self._prompt_inference(
+                mode,
+                tts_text=request.text,
+                instruct_text=request.instruct_text or '',
+                zero_shot_spk_id=request.zero_shot_spk_id,
+                text_frontend=request.text_frontend,
+                speed=request.speed,
+                cancel_token=request.cancel_token
+            )
+            return self._collect_segments(outputs, request.text)
+        
+        return await self._run_synthesis(_synthesize, request, request_id)
+    
+    def _saved_speaker_mode(self, request: TTSRequest) -> SynthesisMode:
+        """确定已保存音色请求的推理方式，音色不存在时报错而不是退回默认参考音频"""
+        if not self.has_saved_speaker(request.zero_shot_spk_id):
+            raise ValueError(f"已保存音色不存在: {request.zero_shot_spk_id}")
+        mode = self._SAVED_SPEAKER_MODES[request.mode]
+        if mode == SynthesisMode.INSTRUCT2 and not request.instruct_text:
+            mode = SynthesisMode.ZERO_SHOT
+        return mode
+    
+    def has_saved_speaker(self, speaker_id: str) -> bool:
+        """是否为已保存的说话人（模型spk2info或说话人注册表）"""
+        return bool(speaker_id) and (
+            speaker_id in getattr(self.cosyvoice.frontend, 'spk2info', {}) or
+            speaker_id in self._default_voices or
+            self._speaker_contexts.contains(speaker_id) or
+            speaker_id in self.speakers
+        )
+    
     async def _basic_synthesis(self, request: TTSRequest, request_id: str) -> TTSResult:
         """基础语音合成 - 对于CosyVoice2，这实际上是零样本合成的默认版本"""
         def _synthesize():
@@ -378,79 +2093,53 @@ class CosyVoice2Engine:
             if available_spks and not is_cosyvoice2:
                 # 传统CosyVoice，使用SFT模式
                 speaker = request.speaker if request.speaker in available_spks else available_spks[0]
-                for audio_output in self.cosyvoice.inference_sft(request.text, speaker):
-                    return audio_output['tts_speech']
+                outputs = self.cosyvoice.inference_sft(request.text, speaker, speed=request.speed)
+                return self._collect_segments(outputs, request.text)
             else:
-                # CosyVoice2或没有预定义说话人，使用默认音频进行零样本合成
-                import os
-                import numpy as np
-                
-                # 创建默认的静音音频作为参考（如果没有其他选择）
-                default_audio_path = None
-                
-                # 首先尝试使用现有的测试音频
-                for test_file in ["test_audio_better.wav", "test_audio_short.wav"]:
-                    if os.path.exists(test_file):
-                        default_audio_path = test_file
-                        break
-                
-                if not default_audio_path:
-                    # 如果没有测试音频，创建一个临时的静音音频
-                    import tempfile
-                    import torchaudio
-                    
-                    # 生成1秒的静音音频 (16kHz)
-                    silent_audio = torch.zeros(1, 16000)  # 1秒静音
-                    temp_file = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-                    torchaudio.save(temp_file.name, silent_audio, 16000)
-                    default_audio_path = temp_file.name
-                
-                # 加载默认音频
-                prompt_audio_data = AudioFileHandler.load_audio_data(default_audio_path)
-                
-                # 使用零样本合成，使用最小的提示文本
-                for audio_output in self.cosyvoice.inference_zero_shot(
+                # CosyVoice2或没有预定义说话人，使用初始化时预处理的默认音色进行零样本合成
+                outputs = self._prompt_inference(
+                    SynthesisMode.ZERO_SHOT,
                     tts_text=request.text,
-                    prompt_text="你好",  # 最小提示文本
-                    prompt_speech_16k=prompt_audio_data,
-                    zero_shot_spk_id=request.speaker or ''
-                ):
-                    return audio_output['tts_speech']
+                    zero_shot_spk_id=self._basic_speaker_id(request.speaker),
+                    speed=request.speed,
+                    cancel_token=request.cancel_token
+                )
+                return self._collect_segments(outputs, request.text)
         
-        audio_tensor = await asyncio.get_event_loop().run_in_executor(None, _synthesize)
+        audio_tensor = await self.scheduler.run(_synthesize, cancel_token=request.cancel_token)
         return await self._process_audio_result(audio_tensor, request, request_id, SynthesisMode.BASIC)
     
-    async def _zero_shot_synthesis(self, request: TTSRequest, request_id: str, prompt_audio_path: str) -> TTSResult:
+    async def _zero_shot_synthesis(self, request: TTSRequest, request_id: str, prompt_audio_path: Union[str, bytes]) -> TTSResult:
         """零样本音色克隆"""
         def _synthesize():
-            # 加载音频数据
-            prompt_audio_data = AudioFileHandler.load_audio_data(prompt_audio_path)
-            
-            for audio_output in self.cosyvoice.inference_zero_shot(
+            outputs = self._prompt_inference(
+                SynthesisMode.ZERO_SHOT,
                 tts_text=request.text,
+                prompt_audio=prompt_audio_path,
                 prompt_text=request.prompt_text,
-                prompt_speech_16k=prompt_audio_data,  # 使用音频数据
-                zero_shot_spk_id=request.speaker or ''
-            ):
-                return audio_output['tts_speech']
+                zero_shot_spk_id=request.speaker or '',
+                speed=request.speed,
+                cancel_token=request.cancel_token
+            )
+            return self._collect_segments(outputs, request.text)
         
-        audio_tensor = await asyncio.get_event_loop().run_in_executor(None, _synthesize)
+        audio_tensor = await self.scheduler.run(_synthesize, cancel_token=request.cancel_token)
         return await self._process_audio_result(audio_tensor, request, request_id, SynthesisMode.ZERO_SHOT)
     
-    async def _cross_lingual_synthesis(self, request: TTSRequest, request_id: str, prompt_audio_path: str) -> TTSResult:
+    async def _cross_lingual_synthesis(self, request: TTSRequest, request_id: str, prompt_audio_path: Union[str, bytes]) -> TTSResult:
         """跨语言合成"""
         def _synthesize():
-            # 加载音频数据
-            prompt_audio_data = AudioFileHandler.load_audio_data(prompt_audio_path)
-            
-            for audio_output in self.cosyvoice.inference_cross_lingual(
+            outputs = self._prompt_inference(
+                SynthesisMode.CROSS_LINGUAL,
                 tts_text=request.text,
-                prompt_speech_16k=prompt_audio_data,  # 使用音频数据
-                zero_shot_spk_id=request.speaker or ''
-            ):
-                return audio_output['tts_speech']
+                prompt_audio=prompt_audio_path,
+                zero_shot_spk_id=request.speaker or '',
+                speed=request.speed,
+                cancel_token=request.cancel_token
+            )
+            return self._collect_segments(outputs, request.text)
         
-        audio_tensor = await asyncio.get_event_loop().run_in_executor(None, _synthesize)
+        audio_tensor = await self.scheduler.run(_synthesize, cancel_token=request.cancel_token)
         return await self._process_audio_result(audio_tensor, request, request_id, SynthesisMode.CROSS_LINGUAL)
     
     async def _instruct_synthesis(self, request: TTSRequest, request_id: str) -> TTSResult:
@@ -458,7 +2147,7 @@ class CosyVoice2Engine:
         # 处理参考音频 (CosyVoice2的指令合成需要参考音频)
         prompt_audio_path = None
         if request.prompt_audio:
-            prompt_audio_path = await AudioFileHandler.process_audio_input(request.prompt_audio)
+            prompt_audio_path = await AudioFileHandler.process_audio_input(request.prompt_audio, self.downloader)
         else:
             # 如果没有提供参考音频，创建一个空的音频文件或使用默认
             # 这里我们抛出错误要求用户提供参考音频
@@ -466,48 +2155,43 @@ class CosyVoice2Engine:
         
         try:
             def _synthesize():
-                # 加载音频数据
-                prompt_audio_data = AudioFileHandler.load_audio_data(prompt_audio_path)
-                
-                # CosyVoice2使用inference_instruct2，参数: tts_text, instruct_text, prompt_speech_16k, zero_shot_spk_id, stream, speed, text_frontend
-                for audio_output in self.cosyvoice.inference_instruct2(
+                # CosyVoice2的指令合成对应inference_instruct2
+                outputs = self._prompt_inference(
+                    SynthesisMode.INSTRUCT2,
                     tts_text=request.text,
+                    prompt_audio=prompt_audio_path,
                     instruct_text=request.instruct_text,
-                    prompt_speech_16k=prompt_audio_data,  # 使用音频数据
-                    zero_shot_spk_id=request.speaker or ''
-                ):
-                    return audio_output['tts_speech']
+                    zero_shot_spk_id=request.speaker or '',
+                    speed=request.speed,
+                    cancel_token=request.cancel_token
+                )
+                return self._collect_segments(outputs, request.text)
             
-            audio_tensor = await asyncio.get_event_loop().run_in_executor(None, _synthesize)
+            audio_tensor = await self.scheduler.run(_synthesize, cancel_token=request.cancel_token)
             return await self._process_audio_result(audio_tensor, request, request_id, SynthesisMode.INSTRUCT)
         
         finally:
             # 清理临时文件 - 只清理真正的临时文件，保护测试文件
-            if (prompt_audio_path and 
-                prompt_audio_path.startswith(tempfile.gettempdir()) and
-                not prompt_audio_path.endswith(('test_audio_better.wav', 'test_audio_short.wav'))):
-                try:
-                    os.unlink(prompt_audio_path)
-                except:
-                    pass
+            AudioFileHandler.discard_temp_file(prompt_audio_path)
     
     async def _instruct2_synthesis(self, request: TTSRequest, request_id: str) -> TTSResult:
         """指令式语音合成 - CosyVoice2的自然语言控制模式"""
         def _synthesize():
-            # 处理参考音频
-            prompt_audio_data = self._get_prompt_audio(request.prompt_audio)
-            
-            # 使用CosyVoice2的inference_instruct2方法
-            for audio_output in self.cosyvoice.inference_instruct2(
+            # 使用CosyVoice2的自然语言控制（inference_instruct2）
+            outputs = self._prompt_inference(
+                SynthesisMode.INSTRUCT2,
                 tts_text=request.text,
+                prompt_audio=self._resolve_prompt_source(request.prompt_audio) if request.prompt_audio is not None else None,
                 instruct_text=request.instruct_text,
-                prompt_speech_16k=prompt_audio_data,
-                zero_shot_spk_id=request.zero_shot_spk_id,
+                zero_shot_spk_id=request.zero_shot_spk_id or (
+                    '' if request.prompt_audio is not None else self._default_voice_id()
+                ),
                 stream=False,
                 speed=request.speed,
-                text_frontend=request.text_frontend
-            ):
-                return audio_output['tts_speech']
+                text_frontend=request.text_frontend,
+                cancel_token=request.cancel_token
+            )
+            return self._collect_segments(outputs, request.text)
         
         return await self._run_synthesis(_synthesize, request, request_id)
     
@@ -518,49 +2202,102 @@ class CosyVoice2Engine:
             source_audio = self._get_prompt_audio(request.prompt_audio)  # 源音频
             target_audio = self._get_prompt_audio(request.prompt_audio)  # 目标音色
             
-            for audio_output in self.cosyvoice.inference_vc(
+            outputs = self.cosyvoice.inference_vc(
                 source_speech_16k=source_audio,
                 prompt_speech_16k=target_audio,
                 stream=False,
                 speed=request.speed
-            ):
-                return audio_output['tts_speech']
+            )
+            return self._collect_segments(outputs, request.text)
         
         return await self._run_synthesis(_synthesize, request, request_id)
     
     async def add_zero_shot_speaker(self, speaker_id: str, prompt_text: str, prompt_audio) -> bool:
         """添加零样本说话人 - 用于全能API"""
         try:
-            prompt_audio_data = self._get_prompt_audio(prompt_audio)
-            success = self.cosyvoice.add_zero_shot_spk(
-                prompt_text=prompt_text,
-                prompt_speech_16k=prompt_audio_data,
-                spk_id=speaker_id
-            )
-            if success:
-                # 保存说话人信息
-                self.cosyvoice.save_spkinfo()
-                logger.info(f"✅ 保存零样本说话人成功: {speaker_id}")
-            return success
+            await self.register_speaker(speaker_id, prompt_text, prompt_audio, kind="zero_shot")
+            logger.info(f"✅ 保存零样本说话人成功: {speaker_id}")
+            return True
+        except SchedulerError:
+            raise
         except Exception as e:
             logger.error(f"添加零样本说话人失败: {e}")
             return False
     
+    async def register_speaker(self, speaker_id: str, prompt_text: str, prompt_audio, **meta) -> dict:
+        """
+        提取参考音频的前端特征并写入说话人注册表
+        特征与零样本合成使用的完全一致，之后按speaker_id合成时不再处理参考音频
+        """
+        source = self._resolve_prompt_source(prompt_audio)
+        
+        def _extract():
+            prompt = self.cosyvoice.frontend.text_normalize(prompt_text or '', split=False, text_frontend=True)
+            features = self._prompt_features(source, prompt)
+            info = self.speakers.put(speaker_id, features, prompt_text=prompt_text, **meta)
+            # 新保存的音色通常马上会被使用，直接放入热点缓存
+            self._speaker_contexts.put(speaker_id, self._materialize_speaker(features))
+            return info
+        
+        return await self.scheduler.run(_extract)
+    
+    def delete_speaker(self, speaker_id: str) -> bool:
+        """从注册表和热点缓存中删除已保存的说话人"""
+        self._speaker_contexts.invalidate(speaker_id)
+        return self.speakers.delete(speaker_id)
+    
+    def _start_speaker_prefetch(self, request: TTSRequest):
+        """请求指定了已保存音色时，在后台预取其设备端特征"""
+        speaker_id = request.zero_shot_spk_id or request.speaker
+        if speaker_id:
+            task = asyncio.ensure_future(self.prefetch_speaker(speaker_id))
+            self._prefetch_tasks.add(task)
+            task.add_done_callback(self._prefetch_tasks.discard)
+    
+    async def prefetch_speaker(self, speaker_id: str):
+        """
+        预取已保存说话人的设备端特征
+        在请求做推理前准备的同时从存储读取并搬到设备上，推理开始时直接命中热点缓存。
+        读取索引和特征都在推理线程中进行，只借用空闲的推理线程并计入并发上限；
+        没有空闲线程时跳过，由推理线程在合成时自行加载
+        """
+        if (not speaker_id or speaker_id in self._prefetching or
+                self._speaker_contexts.contains(speaker_id)):
+            return
+        
+        future = self.scheduler.try_submit(self._saved_speaker_features, speaker_id)
+        if future is None:
+            return
+        self._prefetching.add(speaker_id)
+        try:
+            await asyncio.wrap_future(future)
+        except Exception as e:
+            logger.warning(f"预取说话人失败 {speaker_id}: {e}")
+        finally:
+            self._prefetching.discard(speaker_id)
+    
     def get_saved_speakers(self):
-        """获取已保存的说话人列表 - 用于全能API"""
+        """获取已保存的说话人列表 - 用于全能API，只读取索引"""
         try:
-            # 获取零样本说话人信息
-            spk_info = getattr(self.cosyvoice.frontend, 'spk2info', {})
             saved_speakers = {}
             
+            # 旧版本通过save_spkinfo保存在spk2info中的说话人
+            spk_info = getattr(self.cosyvoice.frontend, 'spk2info', {})
             for spk_id, info in spk_info.items():
                 if isinstance(spk_id, str) and not spk_id.isdigit():  # 排除预训练音色
                     saved_speakers[spk_id] = {
                         "id": spk_id,
                         "type": "zero_shot",
-                        "embedding_shape": info.get('llm_embedding', torch.tensor([])).shape if 'llm_embedding' in info else None
+                        "embedding_shape": list(info['llm_embedding'].shape) if 'llm_embedding' in info else None
                     }
             
+            for info in self.speakers.list_speakers():
+                saved_speakers[info["speaker_id"]] = {
+                    "id": info["speaker_id"],
+                    "type": info.get("kind", "zero_shot"),
+                    "embedding_shape": info.get("embedding_shape")
+                }
+            
             return saved_speakers
         except Exception as e:
             logger.error(f"获取保存说话人失败: {e}")
@@ -570,26 +2307,17 @@ class CosyVoice2Engine:
                                   request_id: str, mode: SynthesisMode) -> TTSResult:
         """处理音频结果，应用后处理和格式转换"""
         try:
-            # 应用语速调整
-            if request.speed != 1.0:
-                try:
-                    import scipy.signal
-                    audio_np = audio_tensor.cpu().numpy()
-                    new_length = int(audio_np.shape[1] / request.speed)
-                    if new_length > 0:
-                        resampled = scipy.signal.resample(audio_np, new_length, axis=1)
-                        audio_tensor = torch.from_numpy(resampled).float()
-                except Exception as e:
-                    logger.warning(f"语速调整失败: {e}")
-            
+            # 语速已由模型在推理时调整（非流式模式原生支持speed参数）
             # 重采样
             sample_rate = getattr(self.cosyvoice, 'sample_rate', 22050)
             target_sample_rate = request.sample_rate or sample_rate
             
+            if request.format == AudioFormat.OPUS and target_sample_rate not in OPUS_SAMPLE_RATES:
+                target_sample_rate = 48000
+            
             if sample_rate != target_sample_rate:
                 try:
-                    resampler = torchaudio.transforms.Resample(sample_rate, target_sample_rate)
-                    audio_tensor = resampler(audio_tensor)
+                    audio_tensor = resample_audio(audio_tensor, sample_rate, target_sample_rate)
                     sample_rate = target_sample_rate
                 except Exception as e:
                     logger.warning(f"重采样失败: {e}")
@@ -603,12 +2331,15 @@ class CosyVoice2Engine:
             os.makedirs(os.path.dirname(output_file), exist_ok=True)
             
             # 根据格式保存
-            if request.format == AudioFormat.WAV:
-                torchaudio.save(output_file, audio_tensor, sample_rate, format="wav")
-            elif request.format == AudioFormat.MP3:
-                torchaudio.save(output_file, audio_tensor, sample_rate, format="mp3")
-            elif request.format == AudioFormat.FLAC:
-                torchaudio.save(output_file, audio_tensor, sample_rate, format="flac")
+            if request.format == AudioFormat.PCM:
+                with open(output_file, 'wb') as f:
+                    f.write(PCM16StreamEncoder(audio_tensor.shape[-1]).encode(audio_tensor))
+            else:
+                encoder = SoundFileEncoder(request.format, sample_rate, output_file)
+                try:
+                    encoder.encode(audio_tensor)
+                finally:
+                    encoder.finish()
             
             # 获取文件信息
             file_size = os.path.getsize(output_file)
@@ -632,15 +2363,22 @@ class CosyVoice2Engine:
                 request_id=request_id
             )
     
-    async def synthesize_stream(self, request: TTSRequest) -> AsyncGenerator[bytes, None]:
-        """流式合成 - 返回音频数据流"""
+    async def synthesize_stream(self, request: TTSRequest) -> AsyncGenerator[memoryview, None]:
+        """
+        流式合成 - 返回音频数据流
+        WAV格式先发送一个长度未知的流式文件头，PCM格式只输出原始s16le数据，MP3/FLAC/Opus在工作线程中增量编码；
+        WAV/PCM音频块以复用缓冲区上的memoryview返回，需在请求下一块之前消费
+        """
         if not self.is_initialized:
             raise RuntimeError("引擎未初始化")
-        
+        sample_rate = getattr(self.cosyvoice, 'sample_rate', 22050)
+        check_stream_format(request.format, sample_rate)
+        self._start_speaker_prefetch(request)
+
         # 处理参考音频
         prompt_audio_path = None
         if request.prompt_audio:
-            prompt_audio_path = await AudioFileHandler.process_audio_input(request.prompt_audio)
+            prompt_audio_path = await AudioFileHandler.process_audio_input(request.prompt_audio, self.downloader)
         
         # 用于清理的路径变量
         cleanup_path = prompt_audio_path
@@ -648,7 +2386,17 @@ class CosyVoice2Engine:
         try:
             def _stream_synthesize():
                 nonlocal cleanup_path, prompt_audio_path
-                if request.mode == SynthesisMode.BASIC:
+                if request.zero_shot_spk_id and request.mode in self._SAVED_SPEAKER_MODES:
+                    return self._prompt_inference(
+                        self._saved_speaker_mode(request),
+                        tts_text=request.text,
+                        instruct_text=request.instruct_text or '',
+                        zero_shot_spk_id=request.zero_shot_spk_id,
+                        stream=True,
+                        text_frontend=request.text_frontend,
+                        cancel_token=request.cancel_token
+                    )
+                elif request.mode == SynthesisMode.BASIC:
                     # 与基础合成相同的逻辑
                     available_spks = self.cosyvoice.list_available_spks()
                     
@@ -659,173 +2407,522 @@ class CosyVoice2Engine:
                     if available_spks and not is_cosyvoice2:
                         # 传统CosyVoice，使用SFT模式
                         speaker = request.speaker if request.speaker in available_spks else available_spks[0]
-                        return self.cosyvoice.inference_sft(request.text, speaker)
+                        return self.cosyvoice.inference_sft(request.text, speaker, stream=True)
                     else:
-                        # CosyVoice2或没有预定义说话人，使用默认音频进行零样本合成
-                        import os
-                        import numpy as np
-                        
-                        # 创建默认的静音音频作为参考（如果没有其他选择）
-                        default_audio_path = None
-                        
-                        # 首先尝试使用现有的测试音频
-                        for test_file in ["test_audio_better.wav", "test_audio_short.wav"]:
-                            if os.path.exists(test_file):
-                                default_audio_path = test_file
-                                break
-                        
-                        if not default_audio_path:
-                            # 如果没有测试音频，创建一个临时的静音音频
-                            import tempfile
-                            import torchaudio
-                            
-                            # 生成1秒的静音音频 (16kHz)
-                            silent_audio = torch.zeros(1, 16000)  # 1秒静音
-                            temp_file = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-                            torchaudio.save(temp_file.name, silent_audio, 16000)
-                            default_audio_path = temp_file.name
-                        
-                        prompt_audio_data = AudioFileHandler.load_audio_data(default_audio_path)
-                        return self.cosyvoice.inference_zero_shot(
+                        # CosyVoice2或没有预定义说话人，使用初始化时预处理的默认音色进行零样本合成
+                        return self._prompt_inference(
+                            SynthesisMode.ZERO_SHOT,
                             tts_text=request.text,
-                            prompt_text="你好",  # 最小提示文本
-                            prompt_speech_16k=prompt_audio_data,
-                            zero_shot_spk_id=request.speaker or ''
+                            zero_shot_spk_id=self._basic_speaker_id(request.speaker),
+                            stream=True,
+                            cancel_token=request.cancel_token
                         )
                 elif request.mode == SynthesisMode.ZERO_SHOT:
-                    # 确保有参考音频文件
-                    if not prompt_audio_path:
-                        import os
-                        default_audio_path = "test_audio_better.wav"
-                        if not os.path.exists(default_audio_path):
-                            default_audio_path = "test_audio_short.wav"
-                        if not os.path.exists(default_audio_path):
-                            raise ValueError("零样本合成需要参考音频文件")
-                        prompt_audio_path = default_audio_path
+                    # 未提供参考音频时使用默认音色
+                    speaker_id = request.speaker if self.has_saved_speaker(request.speaker) else (
+                        '' if prompt_audio_path else self._default_voice_id()
+                    )
                     
-                    prompt_audio_data = AudioFileHandler.load_audio_data(prompt_audio_path)
-                    return self.cosyvoice.inference_zero_shot(
-                        tts_text=request.text, 
-                        prompt_text=request.prompt_text or "这是一个标准的中文语音。", 
-                        prompt_speech_16k=prompt_audio_data,
-                        zero_shot_spk_id=request.speaker or ''
+                    return self._prompt_inference(
+                        SynthesisMode.ZERO_SHOT,
+                        tts_text=request.text,
+                        prompt_audio=prompt_audio_path,
+                        prompt_text=request.prompt_text or "这是一个标准的中文语音。",
+                        zero_shot_spk_id=speaker_id,
+                        stream=True,
+                        cancel_token=request.cancel_token
                     )
                 elif request.mode == SynthesisMode.CROSS_LINGUAL:
-                    # 确保有参考音频文件
-                    if not prompt_audio_path:
-                        import os
-                        default_audio_path = "test_audio_better.wav"
-                        if not os.path.exists(default_audio_path):
-                            default_audio_path = "test_audio_short.wav"
-                        if not os.path.exists(default_audio_path):
-                            raise ValueError("跨语言合成需要参考音频文件")
-                        prompt_audio_path = default_audio_path
+                    # 未提供参考音频时使用默认音色
+                    speaker_id = request.speaker if self.has_saved_speaker(request.speaker) else (
+                        '' if prompt_audio_path else self._default_voice_id()
+                    )
                     
-                    prompt_audio_data = AudioFileHandler.load_audio_data(prompt_audio_path)
-                    return self.cosyvoice.inference_cross_lingual(
-                        tts_text=request.text, 
-                        prompt_speech_16k=prompt_audio_data,
-                        zero_shot_spk_id=request.speaker or ''
+                    return self._prompt_inference(
+                        SynthesisMode.CROSS_LINGUAL,
+                        tts_text=request.text,
+                        prompt_audio=prompt_audio_path,
+                        zero_shot_spk_id=speaker_id,
+                        stream=True,
+                        cancel_token=request.cancel_token
                     )
                 elif request.mode == SynthesisMode.INSTRUCT:
-                    # 确保有参考音频文件
-                    if not prompt_audio_path:
-                        import os
-                        default_audio_path = "test_audio_better.wav"
-                        if not os.path.exists(default_audio_path):
-                            default_audio_path = "test_audio_short.wav"
-                        if not os.path.exists(default_audio_path):
-                            raise ValueError("指令式合成需要参考音频文件")
-                        prompt_audio_path = default_audio_path
+                    # 未提供参考音频时使用默认音色
+                    speaker_id = request.speaker if self.has_saved_speaker(request.speaker) else (
+                        '' if prompt_audio_path else self._default_voice_id()
+                    )
                     
-                    prompt_audio_data = AudioFileHandler.load_audio_data(prompt_audio_path)
-                    return self.cosyvoice.inference_instruct2(
-                        tts_text=request.text, 
-                        instruct_text=request.instruct_text or "请用自然的语调朗读。", 
-                        prompt_speech_16k=prompt_audio_data,
-                        zero_shot_spk_id=request.speaker or ''
+                    return self._prompt_inference(
+                        SynthesisMode.INSTRUCT2,
+                        tts_text=request.text,
+                        prompt_audio=prompt_audio_path,
+                        instruct_text=request.instruct_text or "请用自然的语调朗读。",
+                        zero_shot_spk_id=speaker_id,
+                        stream=True,
+                        cancel_token=request.cancel_token
                     )
             
-            # 在线程池中执行流式合成
-            audio_output = await asyncio.get_event_loop().run_in_executor(None, _stream_synthesize)
-            
-            # CosyVoice可能返回生成器或字典，需要处理
-            if hasattr(audio_output, '__iter__') and not isinstance(audio_output, dict):
-                # 如果是生成器，取第一个结果
-                audio_output = next(iter(audio_output))
+            # 在工作线程中驱动流式生成器，逐块转发给消费者
+            encoder = create_stream_encoder(request.format, sample_rate)
+            header = encoder.start()
+            if header:
+                yield memoryview(header)
             
-            audio_tensor = audio_output['tts_speech']
+            def _stream_outputs():
+                outputs = _stream_synthesize()
+                if request.speed != 1.0:
+                    outputs = self._stretch_outputs(outputs, request.speed, sample_rate)
+                if encoder.zero_copy:
+                    return outputs
+                return self._encode_outputs(outputs, encoder)
             
-            # 转换为字节数据
-            import io
-            buffer = io.BytesIO()
-            sample_rate = getattr(self.cosyvoice, 'sample_rate', 22050)
-            torchaudio.save(buffer, audio_tensor, sample_rate, format="wav")
-            
-            # 分块返回音频数据（模拟流式）
-            audio_bytes = buffer.getvalue()
-            chunk_size = 8192  # 8KB 块
-            
-            for i in range(0, len(audio_bytes), chunk_size):
-                yield audio_bytes[i:i + chunk_size]
+            async for audio_chunk in self._iterate_in_worker(_stream_outputs, request.cancel_token):
+                yield encoder.encode(audio_chunk) if encoder.zero_copy else memoryview(audio_chunk)
         
         finally:
             # 清理临时文件 - 只清理真正的临时文件，保护测试文件
-            if (cleanup_path and 
-                cleanup_path.startswith(tempfile.gettempdir()) and
-                not cleanup_path.endswith(('test_audio_better.wav', 'test_audio_short.wav'))):
+            AudioFileHandler.discard_temp_file(cleanup_path)
+    
+    def _encode_outputs(self, outputs, encoder: AudioEncoder):
+        """
+        压缩编码在工作线程中逐块完成，不占用事件循环
+        编码结果沿用tts_speech键交给_iterate_in_worker转发；编码器可能暂存数据，没有新输出的块直接跳过
+        """
+        try:
+            for audio_output in outputs:
+                data = encoder.encode(audio_output['tts_speech'])
+                if data:
+                    yield {'tts_speech': data}
+            data = encoder.finish()
+            if data:
+                yield {'tts_speech': data}
+        finally:
+            encoder.close()
+            if hasattr(outputs, 'close'):
+                outputs.close()
+    
+    def _stretch_outputs(self, outputs, speed: float, sample_rate: int):
+        """
+        流式变速：在工作线程中逐块做WSOLA时间伸缩
+        模型的speed参数只支持非流式推理，流式请求在这里调整语速且不改变音高
+        """
+        stretcher = WSOLAStretcher(speed, sample_rate)
+        try:
+            for audio_output in outputs:
+                audio = stretcher.process(audio_output['tts_speech'])
+                if audio.shape[-1]:
+                    yield {'tts_speech': audio}
+            audio = stretcher.flush()
+            if audio.shape[-1]:
+                yield {'tts_speech': audio}
+        finally:
+            if hasattr(outputs, 'close'):
+                outputs.close()
+    
+    def _collect_segments(self, outputs, text: str) -> torch.Tensor:
+        """消费生成器的全部片段并拼接为完整音频"""
+        assembler = SegmentAssembler(len(text or ''))
+        for audio_output in outputs:
+            assembler.append(audio_output['tts_speech'])
+        
+        if assembler.segment_count > 1:
+            logger.debug(f"拼接合成片段: {assembler.segment_count} 段, {assembler.length} 采样点")
+        return assembler.finish()
+    
+    async def _iterate_in_worker(self, make_generator,
+                                 cancel_token: Optional[CancelToken] = None) -> AsyncGenerator[torch.Tensor, None]:
+        """
+        在工作线程中驱动CosyVoice生成器，通过有界队列逐块转发音频
+        生成器每产出一个tts_speech块就立即交给异步消费者，队列满时工作线程阻塞等待；
+        消费者未读完就离开时设置cancel_token，工作线程在下一个检查点停止推理
+        """
+        loop = asyncio.get_event_loop()
+        chunk_queue = asyncio.Queue(maxsize=max(1, self.config.cosyvoice.stream_queue_size))
+        stop_event = cancel_token or CancelToken()
+        end_of_stream = object()
+        finished = False
+        
+        def _put(item) -> bool:
+            future = asyncio.run_coroutine_threadsafe(chunk_queue.put(item), loop)
+            while True:
                 try:
-                    os.unlink(cleanup_path)
-                except:
-                    pass
+                    future.result(timeout=0.1)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    # 消费者已离开，放弃投递
+                    if stop_event.cancelled:
+                        future.cancel()
+                        return False
+        
+        def _produce():
+            generator = None
+            try:
+                generator = make_generator()
+                for audio_output in generator:
+                    if stop_event.cancelled or not _put(audio_output['tts_speech']):
+                        break
+            except SynthesisCancelledError as e:
+                logger.info("流式合成已取消，释放推理线程")
+                _put(_WorkerError(e))
+            except BaseException as e:
+                _put(_WorkerError(e))
+            finally:
+                if generator is not None and hasattr(generator, 'close'):
+                    generator.close()
+                _put(end_of_stream)
+        
+        # 流式任务只约束排队时间，不限制总时长
+        future = self.scheduler.submit(
+            _produce, deadline=time.monotonic() + self.scheduler.request_timeout, cancel_token=stop_event
+        )
+        
+        def _on_done(done_future: concurrent.futures.Future):
+            # 任务未能开始执行时（排队超时或被取消），通知消费者结束
+            if done_future.cancelled():
+                loop.call_soon_threadsafe(chunk_queue.put_nowait, _WorkerError(InferenceTimeoutError("推理任务已取消")))
+            elif done_future.exception() is not None:
+                loop.call_soon_threadsafe(chunk_queue.put_nowait, _WorkerError(done_future.exception()))
+        
+        future.add_done_callback(_on_done)
+        
+        try:
+            while True:
+                item = await chunk_queue.get()
+                if item is end_of_stream:
+                    finished = True
+                    break
+                if isinstance(item, _WorkerError):
+                    finished = True
+                    raise item.error
+                yield item
+        finally:
+            if not finished:
+                stop_event.cancel()
     
     def get_available_speakers(self) -> List[str]:
         """获取可用音色列表"""
-        # CosyVoice2采用零样本设计，返回建议的默认音色名称
-        return ["neutral", "female", "male"]
+        # CosyVoice2采用零样本设计，返回内置默认音色名称
+        return list(self._default_voices or self.config.cosyvoice.default_voices)
     
     def cleanup(self):
         """清理资源"""
+        self.scheduler.shutdown()
         if hasattr(self, '_audio_cache'):
             self._audio_cache.clear()
         if hasattr(self, '_speaker_cache'):
             self._speaker_cache.clear()
+        if hasattr(self, '_speaker_contexts'):
+            self._speaker_contexts.clear()
+        if hasattr(self, 'speakers'):
+            self.speakers.close()
 
-    def _get_prompt_audio(self, prompt_audio):
-        """获取参考音频数据"""
+    def _load_prompt(self, source: Union[str, bytes]) -> Tuple[str, torch.Tensor]:
+        """加载参考音频，按内容哈希复用已处理的16kHz张量，返回(内容摘要, 音频张量)；字节数据直接在内存中解码"""
+        digest = self._audio_cache.digest(source)
+        speech = self._audio_cache.get(digest)
+        if speech is not None:
+            return digest, speech
+        
+        url_cache = self.downloader.cache
+        if isinstance(source, str) and url_cache is not None and url_cache.owns(source):
+            # URL缓存的文件同时保存了解码结果，进程重启后也不必重新解码
+            cached = url_cache.load_speech(source)
+            if cached is not None:
+                speech = torch.from_numpy(cached)
+            else:
+                speech = AudioFileHandler.load_audio_data(source)
+                url_cache.store_speech(source, speech.numpy())
+        else:
+            speech = AudioFileHandler.load_audio_data(source)
+        
+        self._audio_cache.put(digest, speech)
+        return digest, speech
+    
+    def _validate_prompt(self, source: Union[str, bytes]) -> bool:
+        """
+        校验参考音频：已解码缓存的来源直接视为有效，否则只读取文件头检查，
+        真正的解码只在_load_prompt中进行一次，结果供特征提取复用
+        """
+        try:
+            if self._audio_cache.contains(self._audio_cache.digest(source)):
+                return True
+        except OSError:
+            pass
+        return AudioFileHandler.validate_audio_file(source)
+    
+    def _load_prompt_speech(self, source: Union[str, bytes]) -> torch.Tensor:
+        """加载参考音频张量"""
+        return self._load_prompt(source)[1]
+    
+    def _prompt_features(self, source: Union[str, bytes], prompt_text: str) -> dict:
+        """
+        获取参考音频的前端特征：提示语音token、说话人向量和梅尔特征
+        按(音频摘要, 提示文本)缓存，复用同一音色时跳过语音tokenizer和说话人编码器
+        """
+        digest, speech = self._load_prompt(source)
+        key = (digest, prompt_text)
+        features = self._speaker_cache.get(key)
+        if features is None:
+            features = self._extract_prompt_features(speech, prompt_text)
+            self._speaker_cache.put(key, features)
+        return features
+    
+    def _extract_prompt_features(self, speech: torch.Tensor, prompt_text: str) -> dict:
+        """运行语音tokenizer、说话人编码器和梅尔特征提取，得到与零样本合成相同的前端特征"""
+        features = self.cosyvoice.frontend.frontend_zero_shot(
+            '', prompt_text, speech, self.cosyvoice.sample_rate, ''
+        )
+        features.pop('text', None)
+        features.pop('text_len', None)
+        return features
+    
+    def _prepare_default_voices(self) -> Dict[str, dict]:
+        """
+        提取内置默认音色的前端特征并放到推理设备上，只执行一次
+        配置的参考音频都不存在时使用内存中的1秒静音音频，不写临时文件
+        """
+        with self._default_voices_lock:
+            if self._default_voices:
+                return self._default_voices
+            
+            frontend = self.cosyvoice.frontend
+            voices = {}
+            for name, voice in self.config.cosyvoice.default_voices.items():
+                audio_path = voice.get("audio")
+                if not audio_path or not os.path.exists(audio_path):
+                    continue
+                try:
+                    prompt = frontend.text_normalize(voice.get("prompt_text", ""), split=False, text_frontend=True)
+                    speech = AudioFileHandler.load_audio_data(audio_path)
+                    voices[name] = self._materialize_speaker(self._extract_prompt_features(speech, prompt))
+                except Exception as e:
+                    logger.error(f"默认音色加载失败 {name}: {e}")
+            
+            if not voices:
+                logger.warning("未找到默认音色参考音频，使用静音音频作为默认音色")
+                prompt = frontend.text_normalize("你好", split=False, text_frontend=True)
+                voices[self.config.cosyvoice.default_voice] = self._materialize_speaker(
+                    self._extract_prompt_features(torch.zeros(1, 16000), prompt)
+                )
+            
+            self._default_voices = voices
+            logger.info(f"默认音色已就绪: {list(voices)}")
+            return voices
+    
+    def _default_voice_id(self, speaker: Optional[str] = None) -> str:
+        """选择默认音色：指定的名称存在时使用它，否则使用配置的默认音色"""
+        voices = self._prepare_default_voices()
+        if speaker in voices:
+            return speaker
+        if self.config.cosyvoice.default_voice in voices:
+            return self.config.cosyvoice.default_voice
+        return next(iter(voices))
+    
+    def _basic_speaker_id(self, speaker: Optional[str]) -> str:
+        """基础合成使用的音色：已保存的说话人优先，其次是默认音色"""
+        if speaker and self.has_saved_speaker(speaker):
+            return speaker
+        return self._default_voice_id(speaker)
+    
+    def _saved_speaker_features(self, speaker_id: str) -> Optional[dict]:
+        """
+        查找已保存说话人的前端特征：模型自带的spk2info优先，
+        其次是热点缓存，未命中时从说话人注册表读取并搬到推理设备上
+        """
+        spk2info = getattr(self.cosyvoice.frontend, 'spk2info', {})
+        if speaker_id in spk2info:
+            return spk2info[speaker_id]
+        if speaker_id in self._default_voices:
+            return self._default_voices[speaker_id]
+        
+        features = self._speaker_contexts.get(speaker_id)
+        if features is None:
+            features = self.speakers.get(speaker_id)
+            if features is None:
+                return None
+            features = self._materialize_speaker(features)
+            self._speaker_contexts.put(speaker_id, features)
+        return features
+    
+    def _materialize_speaker(self, features: dict) -> dict:
+        """把说话人特征张量搬到模型所在设备"""
+        device = getattr(self.cosyvoice.model, 'device', None)
+        if device is None:
+            return features
+        return {
+            key: value.to(device) if isinstance(value, torch.Tensor) else value
+            for key, value in features.items()
+        }
+    
+    def _prompt_inference(self, mode: SynthesisMode, tts_text: str, prompt_audio: Union[str, bytes, None] = None,
+                          prompt_text: str = '', instruct_text: str = '', zero_shot_spk_id: str = '',
+                          stream: bool = False, speed: float = 1.0, text_frontend: bool = True,
+                          cancel_token: Optional[CancelToken] = None):
+        """
+        使用缓存的前端特征驱动CosyVoice2模型
+        与inference_zero_shot/inference_cross_lingual/inference_instruct2逐段等价，
+        只是提示音频相关的特征只在首次使用时计算；
+        每个文本段开始前和每个音频块产出后检查cancel_token，取消时抛出SynthesisCancelledError
+        """
+        cancel_token = cancel_token or CancelToken()
+        cancel_token.raise_if_cancelled()
+        frontend = self.cosyvoice.frontend
+        
+        if mode == SynthesisMode.CROSS_LINGUAL:
+            # 跨语言模式去掉LLM中的提示文本和提示语音token
+            prompt = ''
+            dropped = ('prompt_text', 'prompt_text_len', 'llm_prompt_speech_token', 'llm_prompt_speech_token_len')
+        elif mode in (SynthesisMode.INSTRUCT, SynthesisMode.INSTRUCT2):
+            prompt = f"{instruct_text}<|endofprompt|>"
+            dropped = ('llm_prompt_speech_token', 'llm_prompt_speech_token_len')
+        else:
+            prompt = frontend.text_normalize(prompt_text or '', split=False, text_frontend=text_frontend)
+            dropped = ()
+        
+        features = self._saved_speaker_features(zero_shot_spk_id) if zero_shot_spk_id else None
+        if features is None:
+            if prompt_audio is None:
+                raise ValueError("缺少参考音频")
+            features = self._prompt_features(prompt_audio, prompt)
+        elif mode in (SynthesisMode.INSTRUCT, SynthesisMode.INSTRUCT2):
+            # 存储的特征带的是保存音色时的提示文本，指令模式下换成指令文本
+            prompt_text_token, prompt_text_token_len = frontend._extract_text_token(prompt)
+            features = dict(features, prompt_text=prompt_text_token, prompt_text_len=prompt_text_token_len)
+
+        def _segment_outputs(text: str):
+            for segment in frontend.text_normalize(text, split=True, text_frontend=text_frontend):
+                cancel_token.raise_if_cancelled()
+                text_token, text_token_len = frontend._extract_text_token(segment)
+                model_input = {k: v for k, v in features.items() if k not in dropped}
+                model_input['text'] = text_token
+                model_input['text_len'] = text_token_len
+                for model_output in self.cosyvoice.model.tts(**model_input, stream=stream, speed=speed):
+                    cancel_token.raise_if_cancelled()
+                    yield model_output
+        
+        sentences = TextSegmenter.split(tts_text, self.config.cosyvoice.segment_max_chars)
+        if len(sentences) > 1:
+            yield from self._pipelined_outputs(sentences, _segment_outputs)
+        else:
+            yield from _segment_outputs(tts_text)
+    
+    def _pipelined_outputs(self, sentences: List[str], make_outputs):
+        """
+        分句流水线合成
+        当前句在调用线程中被消费（flow/声码器）时，后续句子借用推理线程池的空闲线程提前开始LLM推理；
+        没有空闲线程时不等待，后续句子在调用线程中顺序推理，预取占用的线程计入max_concurrent_requests。
+        同时在途的句子数和每句缓冲的音频块数都有上限，长文本内存占用有界，结果按原顺序输出
+        """
+        lookahead = max(0, self.config.cosyvoice.pipeline_lookahead)
+        buffer_size = max(1, self.config.cosyvoice.stream_queue_size)
+        end_of_segment = object()
+        
+        def _start(sentence: str):
+            segment_queue = queue.Queue(maxsize=buffer_size)
+            stop_event = threading.Event()
+            
+            def _put(item) -> bool:
+                while not stop_event.is_set():
+                    try:
+                        segment_queue.put(item, timeout=0.1)
+                        return True
+                    except queue.Full:
+                        continue
+                return False
+            
+            def _drain():
+                outputs = None
+                try:
+                    outputs = make_outputs(sentence)
+                    for output in outputs:
+                        if not _put(output):
+                            break
+                except BaseException as e:
+                    _put(_WorkerError(e))
+                finally:
+                    if outputs is not None:
+                        outputs.close()
+                    _put(end_of_segment)
+            
+            future = self.scheduler.try_submit(_drain)
+            if future is None:
+                return None
+            return segment_queue, stop_event, future
+        
+        prefetched = {}  # 句子序号 -> (输出队列, 停止标志, future)
+        try:
+            for index, sentence in enumerate(sentences):
+                for ahead in range(index + 1, min(len(sentences), index + 1 + lookahead)):
+                    if ahead in prefetched:
+                        continue
+                    job = _start(sentences[ahead])
+                    if job is None:
+                        break
+                    prefetched[ahead] = job
+                
+                job = prefetched.pop(index, None)
+                if job is not None and job[2].cancel():
+                    # 预取任务还没开始执行，改在调用线程中推理，避免等待线程池
+                    job = None
+                if job is None:
+                    yield from make_outputs(sentence)
+                    continue
+                
+                segment_queue = job[0]
+                while True:
+                    item = segment_queue.get()
+                    if item is end_of_segment:
+                        break
+                    if isinstance(item, _WorkerError):
+                        raise item.error
+                    yield item
+        finally:
+            for _, stop_event, future in prefetched.values():
+                stop_event.set()
+                future.cancel()
+    
+    def invalidate_prompt_audio(self, source: Union[str, bytes, None] = None) -> bool:
+        """失效参考音频缓存，不指定来源时清空全部"""
+        if source is None:
+            self._audio_cache.clear()
+            return True
+        return self._audio_cache.invalidate_source(source)
+    
+    def get_cache_stats(self) -> dict:
+        """获取缓存统计信息"""
+        return {
+            "prompt_audio": self._audio_cache.stats(),
+            "speaker_features": self._speaker_cache.stats(),
+            "speaker_contexts": self._speaker_contexts.stats(),
+            "resamplers": _resampler_cache.stats()
+        }
+    
+    def _resolve_prompt_source(self, prompt_audio) -> Union[str, bytes]:
+        """确定参考音频来源（文件路径或字节数据），未提供时使用默认音频"""
         if prompt_audio is None:
-            # 使用默认音频
-            import os
-            for test_file in ["test_audio_better.wav", "test_audio_short.wav"]:
-                if os.path.exists(test_file):
-                    return AudioFileHandler.load_audio_data(test_file)
-            
-            # 如果没有测试音频，创建静音音频
-            import tempfile
-            import torchaudio
-            silent_audio = torch.zeros(1, 16000)  # 1秒静音
-            temp_file = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-            torchaudio.save(temp_file.name, silent_audio, 16000)
-            return AudioFileHandler.load_audio_data(temp_file.name)
-        
-        if isinstance(prompt_audio, str):
-            # 文件路径或URL
-            return AudioFileHandler.load_audio_data(prompt_audio)
-        elif isinstance(prompt_audio, bytes):
-            # 音频字节数据
-            import tempfile
-            temp_file = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-            temp_file.write(prompt_audio)
-            temp_file.close()
-            return AudioFileHandler.load_audio_data(temp_file.name)
+            # 使用配置的默认音色参考音频，都不存在时使用内存中的静音音频
+            for voice in self.config.cosyvoice.default_voices.values():
+                if voice.get("audio") and os.path.exists(voice["audio"]):
+                    return voice["audio"]
+            return silent_wav_bytes()
+        
+        if isinstance(prompt_audio, (str, bytes)):
+            # 文件路径或音频字节数据
+            return prompt_audio
         else:
             raise ValueError(f"不支持的音频输入类型: {type(prompt_audio)}")
     
+    def _get_prompt_audio(self, prompt_audio):
+        """获取参考音频数据"""
+        return self._load_prompt_speech(self._resolve_prompt_source(prompt_audio))
+    
     async def _run_synthesis(self, synthesize_func, request: TTSRequest, request_id: str) -> TTSResult:
         """运行合成函数的通用方法"""
         try:
-            audio_tensor = await asyncio.get_event_loop().run_in_executor(None, synthesize_func)
+            audio_tensor = await self.scheduler.run(synthesize_func, cancel_token=request.cancel_token)
             return await self._process_audio_result(audio_tensor, request, request_id, request.mode)
+        except SchedulerError:
+            raise
         except Exception as e:
             logger.error(f"合成失败: {e}")
             return TTSResult(
@@ -839,7 +2936,6 @@ class CosyVoice2Service:
     
     def __init__(self):
         self.engine = CosyVoice2Engine()
-        self.custom_speakers = {}  # 自定义音色存储
         self.config = get_config()
     
     async def initialize(self) -> bool:
@@ -858,7 +2954,7 @@ class CosyVoice2Service:
         """语音合成"""
         return await self.engine.synthesize(request)
     
-    async def synthesize_stream(self, request: TTSRequest) -> AsyncGenerator[bytes, None]:
+    async def synthesize_stream(self, request: TTSRequest) -> AsyncGenerator[memoryview, None]:
         """流式语音合成"""
         async for chunk in self.engine.synthesize_stream(request):
             yield chunk
@@ -868,52 +2964,27 @@ class CosyVoice2Service:
         """添加自定义音色"""
         try:
             # 处理音频输入
-            prompt_audio_path = await AudioFileHandler.process_audio_input(prompt_audio)
+            prompt_audio_path = await AudioFileHandler.process_audio_input(prompt_audio, self.engine.downloader)
             
             # 验证音频
             if not AudioFileHandler.validate_audio_file(prompt_audio_path):
                 # 清理临时文件
-                if prompt_audio_path and prompt_audio_path.startswith(tempfile.gettempdir()):
-                    try:
-                        os.unlink(prompt_audio_path)
-                    except:
-                        pass
+                AudioFileHandler.discard_temp_file(prompt_audio_path)
                 return {"success": False, "error": "音频文件格式无效"}
             
             # 生成音色ID
             speaker_id = hashlib.md5(f"{speaker_name}_{prompt_text}".encode()).hexdigest()[:16]
             
-            # 如果是固定测试文件，不需要复制
-            if isinstance(prompt_audio, str) and not prompt_audio.startswith(('http://', 'https://')):
-                # 直接使用本地文件路径
-                if os.path.exists(prompt_audio):
-                    final_audio_path = prompt_audio
-                else:
-                    final_audio_path = prompt_audio_path
-            else:
-                # 为上传的音频创建永久副本
-                import shutil
-                permanent_path = f"custom_speakers/{speaker_id}.wav"
-                os.makedirs("custom_speakers", exist_ok=True)
-                shutil.copy2(prompt_audio_path, permanent_path)
-                final_audio_path = permanent_path
-                
-                # 清理临时文件
-                if prompt_audio_path.startswith(tempfile.gettempdir()):
-                    try:
-                        os.unlink(prompt_audio_path)
-                    except:
-                        pass
-            
-            # 保存自定义音色信息
-            self.custom_speakers[speaker_id] = {
-                "speaker_name": speaker_name,
-                "speaker_id": speaker_id,
-                "prompt_text": prompt_text,
-                "prompt_audio_path": final_audio_path,
-                "description": description or f"自定义音色: {speaker_name}",
-                "created_at": str(uuid.uuid4())
-            }
+            # 提取前端特征并持久化，之后合成不再需要参考音频文件
+            try:
+                await self.engine.register_speaker(
+                    speaker_id, prompt_text, prompt_audio_path,
+                    kind="custom",
+                    speaker_name=speaker_name,
+                    description=description or f"自定义音色: {speaker_name}"
+                )
+            finally:
+                AudioFileHandler.discard_temp_file(prompt_audio_path)
             
             logger.info(f"✅ 自定义音色添加成功: {speaker_name} -> {speaker_id}")
             return {"success": True, "speaker_id": speaker_id}
@@ -924,25 +2995,14 @@ class CosyVoice2Service:
     
     def get_custom_speakers(self) -> list:
         """获取自定义音色列表"""
-        return list(self.custom_speakers.values())
+        return self.engine.speakers.list_speakers(kind="custom")
     
     async def delete_custom_speaker(self, speaker_id: str) -> dict:
         """删除自定义音色"""
         try:
-            if speaker_id in self.custom_speakers:
-                speaker_info = self.custom_speakers[speaker_id]
-                
-                # 清理音频文件 - 但不删除测试文件
-                audio_path = speaker_info.get("prompt_audio_path")
-                if (audio_path and os.path.exists(audio_path) and
-                    not audio_path.endswith(('test_audio_better.wav', 'test_audio_short.wav'))):
-                    try:
-                        os.unlink(audio_path)
-                    except:
-                        pass
-                
-                # 删除记录
-                del self.custom_speakers[speaker_id]
+            info = self.engine.speakers.info(speaker_id)
+            if info is not None and info.get("kind") == "custom":
+                self.engine.delete_speaker(speaker_id)
                 
                 logger.info(f"✅ 自定义音色删除成功: {speaker_id}")
                 return {"success": True}
@@ -959,28 +3019,41 @@ class CosyVoice2Service:
             "initialized": self.engine.is_initialized,
             "capabilities": self.engine.capabilities,
             "model_path": self.config.cosyvoice.model_path,
-            "custom_speakers_count": len(self.custom_speakers)
+            "custom_speakers_count": len(self.get_custom_speakers()),
+            "speaker_registry": self.engine.speakers.stats(),
+            "caches": self.engine.get_cache_stats(),
+            "scheduler": self.engine.scheduler.stats(),
+            "downloads": self.engine.downloader.stats()
         }
     
     def get_available_speakers(self) -> List[str]:
         """获取可用音色"""
         return self.engine.get_available_speakers()
     
+    def get_sample_rate(self) -> int:
+        """获取模型输出采样率"""
+        return getattr(self.engine.cosyvoice, 'sample_rate', 22050)
+    
+    def check_stream_format(self, audio_format: AudioFormat):
+        """检查流式输出格式是否支持模型采样率，不支持时抛出ValueError"""
+        check_stream_format(audio_format, self.get_sample_rate())
+    
+    def check_capacity(self):
+        """检查推理队列是否还有余量，已满时抛出SchedulerBusyError"""
+        self.engine.scheduler.check_capacity()
+    
+    def invalidate_prompt_audio(self, source: Union[str, bytes, None] = None) -> bool:
+        """失效参考音频缓存"""
+        return self.engine.invalidate_prompt_audio(source)
+    
     def cleanup(self):
-        """清理资源"""
+        """清理资源，已保存的音色保留在注册表中"""
         self.engine.cleanup()
-        
-        # 清理自定义音色文件 - 但不删除测试文件
-        for speaker_info in self.custom_speakers.values():
-            audio_path = speaker_info.get("prompt_audio_path")
-            if (audio_path and os.path.exists(audio_path) and
-                not audio_path.endswith(('test_audio_better.wav', 'test_audio_short.wav'))):
-                try:
-                    os.unlink(audio_path)
-                except:
-                    pass
-        
-        self.custom_speakers.clear()
+    
+    async def close(self):
+        """关闭服务：先释放下载连接池，再清理引擎资源"""
+        await self.engine.downloader.close()
+        self.cleanup()
 
     async def add_zero_shot_speaker(self, speaker_id: str, prompt_text: str, prompt_audio) -> bool:
         """添加零样本说话人 - 用于全能API"""